@@ -0,0 +1,135 @@
+"""Mininet-WiFi: A simple networking testbed for Wireless OpenFlow/SDWN!
+
+   Batched link evaluation. Station and AP positions and AP ranges are
+   kept in NumPy arrays and the whole station x AP distance matrix is
+   computed in one step, the RSSI of the pairs in range in another one
+   (propagationModel.rssi_matrix). Only the stations whose APs in range,
+   distances or RSSI changed since the previous tick are handed over to
+   mobility/Association."""
+
+import numpy as np
+
+from mn_wifi.propagationModels import propagationModel as ppm
+from mn_wifi.wmediumdConnector import w_cst, wmediumd_mode
+
+
+class associationEngine(object):
+    "Vectorized replacement of the per pair loop of mobility.configureLinks"
+
+    def __init__(self):
+        self.aps = None    # list the engine was built from
+        self.size = 0      # len(self.aps) at build time
+        self.cols = []     # [(ap, ap wlans usable for association)]
+        self.col = {}      # ap -> column
+        self.ap_pos = np.zeros((0, 3))
+        self.ap_range = np.zeros(0)
+        self.last = {}     # (sta, wlan) -> (in range mask, distances, rssi)
+
+    @staticmethod
+    def get_pos(node):
+        pos = node.params.get('position', (np.nan, np.nan, np.nan))
+        return [float(pos[0]), float(pos[1]), float(pos[2])]
+
+    def build(self, aps, func):
+        "(Re)builds the AP columns"
+        self.aps = aps
+        self.size = len(aps)
+        self.cols = []
+        for ap in aps:
+            wlans = [ap_wlan for ap_wlan in range(len(ap.params['wlan']))
+                     if ap.func[ap_wlan] not in func]
+            if wlans:
+                self.cols.append((ap, wlans))
+        self.col = dict((ap, idx) for idx, (ap, _) in enumerate(self.cols))
+        self.last = {}
+
+    def load_aps(self):
+        "Copies AP positions and ranges into the arrays"
+        self.ap_pos = np.array([self.get_pos(ap) for ap, _ in self.cols],
+                               dtype=float).reshape(-1, 3)
+        self.ap_range = np.array([float(ap.params['range'][0])
+                                  for ap, _ in self.cols], dtype=float)
+
+    def invalidate(self, node):
+        "Forgets the last state of node (e.g. txpower or range changed)"
+        if node in self.col:
+            self.last = {}
+        else:
+            for key in [key for key in self.last if key[0] == node]:
+                del self.last[key]
+
+    def distances(self, sta_pos):
+        "Station x AP distance matrix, rounded as in get_distance_to"
+        diff = sta_pos[:, np.newaxis, :] - self.ap_pos[np.newaxis, :, :]
+        return np.round(np.sqrt((diff ** 2).sum(axis=2)), 2)
+
+    def rssi(self, rows, dist, in_range):
+        "RSSI matrix of the pairs in range (NaN elsewhere)"
+        rssi = np.full(dist.shape, np.nan)
+        cols = np.flatnonzero(in_range.any(axis=0))
+        if len(cols):
+            rssi[:, cols] = ppm.rssi_matrix(
+                [self.cols[col][0] for col in cols], [sta for sta, _ in rows],
+                dist[:, cols], wlan=[wlan for _, wlan in rows])
+        rssi[~in_range] = np.nan
+        return rssi
+
+    def configure(self, nodes, mob):
+        """Evaluates the links of nodes. Returns the nodes that must go
+        through the per pair path (bgscan/active_scan with interference)"""
+        if self.aps is not mob.aps or self.size != len(mob.aps):
+            self.build(mob.aps, mob.func)
+        rows = []
+        scalar = []
+        interference = wmediumd_mode.mode == w_cst.INTERFERENCE_MODE
+        for node in nodes:
+            if interference and ('bgscan_threshold' in node.params or
+                                 'active_scan' in node.params):
+                scalar.append(node)
+                continue
+            for wlan in range(len(node.params['wlan'])):
+                if node.func[wlan] != 'mesh' and node.func[wlan] != 'adhoc':
+                    rows.append((node, wlan))
+        if not rows or not self.cols:
+            return scalar
+
+        self.load_aps()
+        sta_pos = np.array([self.get_pos(sta) for sta, _ in rows],
+                           dtype=float).reshape(-1, 3)
+        dist = self.distances(sta_pos)
+        in_range = dist <= self.ap_range
+        rssi = self.rssi(rows, dist, in_range)
+        for idx, (sta, wlan) in enumerate(rows):
+            self.update(sta, wlan, in_range[idx], dist[idx], rssi[idx], mob)
+        return scalar
+
+    def update(self, sta, wlan, mask, dist, rssi, mob):
+        "Emits the events of a single (station, wlan) row"
+        key = (sta, wlan)
+        last = self.last.get(key)
+        inside = np.flatnonzero(mask)
+        if last is not None and not mob.ac and \
+                sta.params['associatedTo'][wlan] and \
+                np.array_equal(mask, last[0]) and \
+                np.array_equal(dist[inside], last[1][inside]) and \
+                np.array_equal(rssi[inside], last[2][inside]):
+            return
+        self.last[key] = (mask, dist, rssi)
+
+        # APs known by the station which are now out of range
+        known = list(sta.params['apsInRange'])
+        associatedTo = sta.params['associatedTo'][wlan]
+        if associatedTo in self.col and associatedTo not in known:
+            known.append(associatedTo)
+        gone = [ap for ap in known if ap in self.col and not mask[self.col[ap]]]
+        gone.sort(key=self.col.get)
+        for ap in gone:
+            for ap_wlan in self.cols[self.col[ap]][1]:
+                mob.ap_out_of_range(sta, ap, wlan, ap_wlan)
+        if len(inside) < len(mask) and not sta.params['associatedTo'][wlan]:
+            sta.params['rssi'][wlan] = 0
+
+        aps = [self.cols[col][0] for col in inside]
+        links = dict((ap, (float(dist[col]), float(rssi[col])))
+                     for ap, col in zip(aps, inside))
+        mob.set_handover(sta, aps, wlan, links)
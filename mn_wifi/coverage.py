@@ -0,0 +1,114 @@
+"""Mininet-WiFi: A simple networking testbed for Wireless OpenFlow/SDWN!
+
+   Coverage map: best server RSSI and SINR over a grid covering the plot
+   area, computed with the vectorized propagation models one AP at a
+   time. The map is kept until an AP moves or changes its txpower,
+   antenna or channel, or the propagation model or walls change."""
+
+import numpy as np
+
+from mn_wifi.floorPlan import floorPlan
+from mn_wifi.propagationModels import propagationModel as ppm
+
+
+class coverageMap(object):
+    "Best server RSSI/SINR raster of a set of APs"
+
+    def __init__(self):
+        self.key = None
+        self.aps = []
+        self.x = self.y = self.z = None  # cell centers
+        self.rssi = None  # best RSSI (dBm), [z, y, x] or [y, x]
+        self.sinr = None  # SINR (dB) of the best server
+        self.server = None  # index in self.aps of the best server (-1: none)
+
+    @property
+    def extent(self):
+        "Bounds of the map, as expected by imshow"
+        half = (self.x[1] - self.x[0]) / 2 if len(self.x) > 1 else 0.5
+        return [self.x[0] - half, self.x[-1] + half,
+                self.y[0] - half, self.y[-1] + half]
+
+    @staticmethod
+    def get_state(ap):
+        params = ap.params
+        return (ap.name, tuple(float(p) for p in params['position']),
+                params['txpower'][0], params['antennaGain'][0],
+                params['antennaHeight'][0], params['freq'][0],
+                params['channel'][0])
+
+    def get_key(self, aps, *args):
+        "Everything the map depends on"
+        return (tuple(self.get_state(ap) for ap in aps), ppm.version,
+                floorPlan.version) + args
+
+    def compute(self, aps, min_x=0, min_y=0, max_x=100, max_y=100,
+                resolution=1, z=None, gr=5.0, hr=1.0):
+        """Computes the map, unless nothing changed since the last call
+
+        :param aps: the transmitters (with position)
+        :param resolution: distance between the cells (m)
+        :param z: height of the map, or list of heights for a 3D map
+        :param gr: antenna gain of the receivers
+        :param hr: antenna height of the receivers"""
+        aps = [ap for ap in aps if 'position' in ap.params]
+        key = self.get_key(aps, min_x, min_y, max_x, max_y, resolution,
+                           repr(z), gr, hr)
+        if key == self.key:
+            return False
+
+        self.aps = aps
+        self.x = np.arange(min_x, max_x + resolution / 2.0, resolution,
+                           dtype=float)
+        self.y = np.arange(min_y, max_y + resolution / 2.0, resolution,
+                           dtype=float)
+        heights = [0.0 if z is None else z] if np.isscalar(z) or z is None \
+            else list(z)
+        self.z = np.array(heights, dtype=float)
+        shape = (len(self.z), len(self.y), len(self.x))
+        xy = np.stack(np.meshgrid(self.x, self.y), axis=-1)
+
+        noise = 10 ** (ppm.noise_threshold / 10.0)
+        best = np.full(shape, -np.inf)
+        server = np.full(shape, -1, dtype=int)
+        power = {}  # channel -> received power (mW) of its APs
+        for idx, ap in enumerate(aps):
+            pos = [float(p) for p in ap.params['position']]
+            dxy2 = (self.x - pos[0])[np.newaxis, :] ** 2 + \
+                   (self.y - pos[1])[:, np.newaxis] ** 2
+            dist = np.sqrt(dxy2[np.newaxis] +
+                           ((self.z - pos[2]) ** 2)[:, np.newaxis, np.newaxis])
+            rssi = ppm.rssi_field(ap, dist, gr, hr)
+            if len(floorPlan.walls):
+                rssi -= floorPlan.loss_points(ap, xy)
+            better = rssi > best
+            best[better] = rssi[better]
+            server[better] = idx
+            channel = ap.params['channel'][0]
+            mw = 10 ** (rssi / 10.0)
+            if channel in power:
+                power[channel] += mw
+            else:
+                power[channel] = mw
+
+        interference = np.full(shape, noise)
+        channels = [ap.params['channel'][0] for ap in aps]
+        for channel in power:
+            servers = [idx for idx, ch in enumerate(channels) if ch == channel]
+            mask = np.isin(server, servers)
+            interference[mask] += power[channel][mask] - \
+                10 ** (best[mask] / 10.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sinr = best - 10 * np.log10(np.maximum(interference, noise))
+
+        if z is None or np.isscalar(z):
+            best, sinr, server = best[0], sinr[0], server[0]
+        self.rssi, self.sinr, self.server = best, sinr, server
+        self.key = key
+        return True
+
+    def save(self, filename):
+        "Saves the map as a NumPy .npz file"
+        np.savez(filename, x=self.x, y=self.y, z=self.z, rssi=self.rssi,
+                 sinr=self.sinr, server=self.server,
+                 aps=np.array([ap.name for ap in self.aps]))
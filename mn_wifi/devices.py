@@ -1,13 +1,135 @@
 """Mininet-WiFi: A simple networking testbed for Wireless OpenFlow/SDWN!
    author: Ramon Fontes (ramonrf@dca.fee.unicamp.br)"""
 
+import math
+
+import numpy as np
+
+from mn_wifi.perTable import perTable
+
+
+class rateTable(object):
+    """MCS of a link given its SNR, from the PER tables of mn_wifi/data
+    (perTable). The rate and PER of the MCS with the highest goodput at
+    every dB of RSSI are computed once per mode, channel width, number of
+    spatial streams and guard interval"""
+
+    curves = {}  # (mode, width, streams, sgi) -> (rates, PER) over grid
+    # 802.11ac: data subcarriers relative to 40 MHz
+    subcarriers = {80: 234 / 108.0, 160: 468 / 108.0}
+    max_streams = {'n': 4, 'ac': 8}
+
+    @classmethod
+    def get_columns(cls, mode, width, streams, sgi):
+        """(RSSI, rate, PER, shift) of every MCS, shift being how many dB
+        more the MCS needs than in the table"""
+        rssi, rates, per = perTable.read(perTable.get_name(mode, width, sgi))
+        if mode in ['a', 'b', 'g']:
+            cols = {'b': range(4), 'a': range(4, 12)}.get(mode, range(12))
+            return [(rssi, rates[col], per[:, col], 0) for col in cols]
+
+        # MCS 0-7 use one spatial stream, MCS 8-15 two. More streams split
+        # the power further
+        sets = [(range(8), 1.0)]
+        if streams > 1:
+            sets.append((range(8, 16), streams / 2.0))
+        columns = []
+        for cols, factor in sets:
+            shift = 10 * math.log10(factor)
+            columns += [(rssi, rates[col] * factor, per[:, col], shift)
+                        for col in cols]
+            if mode == 'ac':
+                # 256-QAM 3/4 and 5/6 (MCS 8 and 9), from 64-QAM 5/6
+                rate, col = rates[cols[-1]] * factor, per[:, cols[-1]]
+                columns += [(rssi, rate * 1.2, col, shift + 5),
+                            (rssi, rate * 4 / 3.0, col, shift + 7)]
+        if width in cls.subcarriers:
+            # twice the band: twice the noise
+            shift = 10 * math.log10(width / 40.0)
+            columns = [(rssi_, rate * cls.subcarriers[width], col, s + shift)
+                       for rssi_, rate, col, s in columns]
+        return columns
+
+    @classmethod
+    def get_curve(cls, mode, width=20, streams=1, sgi=False):
+        "Rate (Mbps) and PER of the best MCS at every RSSI of perTable.grid"
+        key = (mode, width, streams, sgi)
+        if key not in cls.curves:
+            columns = cls.get_columns(*key)
+            rates = np.array([column[1] for column in columns])
+            per = np.array([np.interp(perTable.grid - shift, rssi, col)
+                            for rssi, _, col, shift in columns])
+            best = (rates[:, np.newaxis] * (1 - per)).argmax(axis=0)
+            cls.curves[key] = (rates[best],
+                               per[best, np.arange(len(perTable.grid))])
+        return cls.curves[key]
+
+    @staticmethod
+    def get_param(node, wlan, param, default):
+        value = node.params.get(param, default)
+        if isinstance(value, list):
+            value = value[wlan] if wlan < len(value) else default
+        return value
+
+    @classmethod
+    def get_capab(cls, node, wlan):
+        """Channel width, spatial streams and short guard interval of an
+        interface: the width, streams and sgi params, otherwise ht_capab"""
+        ht_capab = str(node.params.get('ht_capab', ''))
+        width = int(cls.get_param(node, wlan, 'width',
+                                  40 if 'HT40' in ht_capab else 20))
+        streams = int(cls.get_param(node, wlan, 'streams', 1))
+        sgi = bool(cls.get_param(node, wlan, 'sgi', 'SHORT-GI' in ht_capab))
+        return width, streams, sgi
+
+    @classmethod
+    def get_link(cls, node, wlan):
+        "(mode, width, streams, sgi) supported by node and by its AP"
+        mode = node.params['mode'][wlan]
+        width, streams, sgi = cls.get_capab(node, wlan)
+        ap = cls.get_param(node, wlan, 'associatedTo', None)
+        if ap:
+            ap_width, ap_streams, ap_sgi = cls.get_capab(ap, 0)
+            width = min(width, ap_width)
+            streams = min(streams, ap_streams)
+            sgi = sgi and ap_sgi
+        width = 20 if width < 40 else min(width, 40 if mode == 'n' else 160)
+        if width not in (20, 40):
+            width = 80 if width < 160 else 160
+        streams = max(1, min(streams, cls.max_streams.get(mode, 1)))
+        return mode, width, streams, sgi
+
+    @classmethod
+    def get(cls, node, wlan, snr):
+        """(rate (Mbps), PER) of the best MCS of the link of node given its
+        SNR (dB), or None for the modes without a table"""
+        mode, width, streams, sgi = cls.get_link(node, wlan)
+        if mode not in ['a', 'b', 'g', 'n', 'ac']:
+            return None
+        rates, per = cls.get_curve(mode, width, streams, sgi)
+        idx = int(round(snr + perTable.noise)) - perTable.grid[0]
+        idx = min(max(idx, 0), len(rates) - 1)
+        return float(rates[idx]), float(per[idx])
+
+    @classmethod
+    def goodput(cls, node, wlan, snr):
+        "Expected goodput (Mbps), rate * (1 - PER), or None"
+        mcs = cls.get(node, wlan, snr)
+        return mcs and mcs[0] * (1 - mcs[1])
+
 
 class CustomRate(object):
 
     rate = 0
 
-    def __init__(self, node, wlan):
+    def __init__(self, node, wlan, snr=None):
+        """snr: SNR (dB) of the link of node. If given, the rate is the
+        one of the best MCS at that SNR (see rateTable)"""
         self.customDataRate_mobility(node, wlan)
+        if snr is not None:
+            mcs = rateTable.get(node, wlan, snr)
+            if mcs:
+                self.rate = mcs[0]
 
     def customDataRate_mobility(self, node, wlan):
         """Custom Maximum Data Rate - Useful when there is mobility
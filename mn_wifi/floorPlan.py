@@ -0,0 +1,287 @@
+"""Mininet-WiFi: A simple networking testbed for Wireless OpenFlow/SDWN!
+
+   Walls of an indoor floor plan and the loss they add to a link. Walls
+   are 2D line segments, each with the loss (dB) of its material. They are
+   kept in a grid so that a ray only looks at the walls of the cells it
+   crosses. For transmitters which keep still (usually APs) the loss to
+   every point of the plan is precomputed once in a raster, so the RSSI
+   path only does a lookup. Moving transmitters are checked against the
+   walls link by link, as a raster would be thrown away at their next
+   move. Only the most recently used rasters are kept."""
+
+import math
+from collections import OrderedDict
+from threading import RLock
+
+import numpy as np
+
+from mn_wifi.scheduler import clock
+
+
+class floorPlan(object):
+    "Walls of the floor plan, their grid and the per transmitter rasters"
+
+    # loss (dB) per wall, usual values at 2.4 GHz
+    materials = {'glass': 2, 'drywall': 3, 'wood': 4, 'brick': 8,
+                 'concrete': 12, 'metal': 25}
+    walls = np.zeros((0, 4))  # x1, y1, x2, y2
+    losses = np.zeros(0)
+    cell_size = 5.0  # of the wall grid (m)
+    cells = {}  # cell -> indices of the walls crossing it
+    resolution = 1.0  # of the rasters (m)
+    origin = np.zeros(2)  # lower left corner of the rasters
+    shape = (0, 0)
+    rasters = OrderedDict()  # transmitter -> (position, raster), LRU
+    max_rasters = 64
+    static_after = 5.0  # seconds a transmitter stays put before a raster
+    seen = {}  # transmitter -> (position, since when it is there)
+    lock = RLock()  # of the rasters and seen
+    version = 0  # changes whenever the walls change
+
+    @classmethod
+    def get_loss_of(cls, material):
+        if material in cls.materials:
+            return float(cls.materials[material])
+        return float(material)
+
+    @classmethod
+    def setWalls(cls, walls, resolution=1, cell_size=5):
+        """Sets the walls of the floor plan
+
+        :param walls: list of (x1, y1, x2, y2, material), material being
+        a key of floorPlan.materials or a loss in dB
+        :param resolution: cell size of the rasters (m)
+        :param cell_size: cell size of the wall grid (m)"""
+        cls.walls = np.array([wall[:4] for wall in walls],
+                             dtype=float).reshape(-1, 4)
+        cls.losses = np.array([cls.get_loss_of(wall[4]) for wall in walls])
+        cls.resolution = float(resolution)
+        cls.cell_size = float(cell_size)
+        cls.build()
+
+    @classmethod
+    def load(cls, filename, **kwargs):
+        """Reads the walls from a file with a 'x1 y1 x2 y2 material' line
+        per wall. Empty lines and lines starting with # are skipped"""
+        walls = []
+        with open(filename) as file_:
+            for line in file_:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                values = line.split()
+                walls.append([float(value) for value in values[:4]] +
+                             [values[4]])
+        cls.setWalls(walls, **kwargs)
+
+    @classmethod
+    def clear(cls):
+        cls.setWalls([])
+
+    @classmethod
+    def get_cell(cls, x, y):
+        return (int(math.floor(x / cls.cell_size)),
+                int(math.floor(y / cls.cell_size)))
+
+    @classmethod
+    def get_cells(cls, x1, y1, x2, y2):
+        """Cells crossed by the segment (x1, y1) - (x2, y2), walking the
+        grid one cell border at a time"""
+        cs = cls.cell_size
+        cx, cy = cls.get_cell(x1, y1)
+        end = cls.get_cell(x2, y2)
+        cells = [(cx, cy)]
+        dx, dy = x2 - x1, y2 - y1
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        # segment parameter at the next vertical/horizontal border
+        if dx:
+            next_x = ((cx + (step_x > 0)) * cs - x1) / dx
+            delta_x = cs / abs(dx)
+        else:
+            next_x = delta_x = float('inf')
+        if dy:
+            next_y = ((cy + (step_y > 0)) * cs - y1) / dy
+            delta_y = cs / abs(dy)
+        else:
+            next_y = delta_y = float('inf')
+        while (cx, cy) != end and min(next_x, next_y) <= 1:
+            if next_x < next_y:
+                cx += step_x
+                next_x += delta_x
+            else:
+                cy += step_y
+                next_y += delta_y
+            cells.append((cx, cy))
+        return cells
+
+    @classmethod
+    def build(cls):
+        "Builds the wall grid and forgets the rasters"
+        with cls.lock:
+            cls.version += 1
+            cls.cells = {}
+            cls.rasters = OrderedDict()
+            cls.seen = {}
+            for idx, (x1, y1, x2, y2) in enumerate(cls.walls):
+                for cell in cls.get_cells(x1, y1, x2, y2):
+                    cls.cells.setdefault(cell, []).append(idx)
+            if len(cls.walls):
+                res = cls.resolution
+                ends = cls.walls[:, :2], cls.walls[:, 2:]
+                low = np.minimum(*ends).min(axis=0)
+                high = np.maximum(*ends).max(axis=0)
+                cls.origin = np.floor(low / res) * res - res
+                cls.shape = tuple(int(size) for size in
+                                  np.ceil((high - cls.origin) / res) + 2)
+            else:
+                cls.origin = np.zeros(2)
+                cls.shape = (0, 0)
+
+    @classmethod
+    def get_rows(cls):
+        "Points checked at once against every wall (about 4M tests)"
+        return max(1024, 4194304 // max(len(cls.walls), 1))
+
+    @staticmethod
+    def crossings(p, q, walls):
+        """Which walls the segments p - q cross. p and q are (..., 2)
+        arrays, the result has one more axis, for the walls. The cross
+        products are written as dot products to run on whole arrays"""
+        a, b = walls[:, :2], walls[:, 2:]
+        ab = b - a
+        normal = np.stack([-ab[:, 1], ab[:, 0]])  # v . normal = ab x v
+        offset = (a * normal.T).sum(axis=1)
+        d1 = np.dot(p, normal) - offset  # ab x (p - a)
+        d2 = np.dot(q, normal) - offset  # ab x (q - a)
+        pq = q - p
+        pq_p = (pq[..., 0] * p[..., 1] - pq[..., 1] * p[..., 0])[..., np.newaxis]
+        d3 = np.dot(pq, np.stack([a[:, 1], -a[:, 0]])) - pq_p  # pq x (a - p)
+        d4 = np.dot(pq, np.stack([b[:, 1], -b[:, 0]])) - pq_p  # pq x (b - p)
+        return (d1 * d2 < 0) & (d3 * d4 < 0)
+
+    @classmethod
+    def ray_loss(cls, p, q):
+        "Loss of the walls between the points p and q (ray casting)"
+        walls = set()
+        for cell in cls.get_cells(p[0], p[1], q[0], q[1]):
+            walls.update(cls.cells.get(cell, ()))
+        if not walls:
+            return 0.0
+        walls = sorted(walls)
+        crossed = cls.crossings(np.array(p[:2], dtype=float),
+                                np.array(q[:2], dtype=float),
+                                cls.walls[walls])
+        return float(cls.losses[walls][crossed].sum())
+
+    @classmethod
+    def build_raster(cls, pos):
+        "Loss from pos to the center of every cell of the raster"
+        rows = cls.get_rows()
+        res = cls.resolution
+        xs = cls.origin[0] + (np.arange(cls.shape[0]) + 0.5) * res
+        ys = cls.origin[1] + (np.arange(cls.shape[1]) + 0.5) * res
+        centers = np.stack(np.meshgrid(xs, ys, indexing='ij'),
+                           axis=-1).reshape(-1, 2)
+        raster = np.empty(len(centers))
+        p = np.array(pos[:2], dtype=float)
+        for start in range(0, len(centers), rows):
+            crossed = cls.crossings(p, centers[start:start + rows], cls.walls)
+            raster[start:start + rows] = crossed.dot(cls.losses)
+        return raster.reshape(cls.shape)
+
+    @staticmethod
+    def get_pos(node):
+        pos = node.params.get('position', (0, 0, 0))
+        return (float(pos[0]), float(pos[1]))
+
+    @classmethod
+    def get_raster(cls, node):
+        "Raster of node, rebuilt when node has moved"
+        pos = cls.get_pos(node)
+        with cls.lock:
+            raster = cls.rasters.pop(node, None)
+            if raster is None or raster[0] != pos:
+                raster = (pos, cls.build_raster(pos))
+            cls.rasters[node] = raster
+            if len(cls.rasters) > cls.max_rasters:
+                cls.rasters.popitem(last=False)
+            return raster[1]
+
+    @classmethod
+    def is_static(cls, node):
+        """Whether node has not moved for static_after seconds (simulation
+        time), i.e. a raster of it is worth building"""
+        pos = cls.get_pos(node)
+        now = clock.now()
+        with cls.lock:
+            raster = cls.rasters.get(node)
+            if raster is not None and raster[0] == pos:
+                return True
+            last = cls.seen.get(node)
+            if last is None or last[0] != pos:
+                cls.seen[node] = (pos, now)
+                return False
+        return now - last[1] >= cls.static_after
+
+    @classmethod
+    def get_loss(cls, tx, rx):
+        """Loss of the walls between tx and rx, from the raster of tx if it
+        does not move"""
+        if not len(cls.walls):
+            return 0.0
+        x, y = cls.get_pos(rx)
+        i = int(math.floor((x - cls.origin[0]) / cls.resolution))
+        j = int(math.floor((y - cls.origin[1]) / cls.resolution))
+        if 0 <= i < cls.shape[0] and 0 <= j < cls.shape[1] and \
+                cls.is_static(tx):
+            return float(cls.get_raster(tx)[i, j])
+        return cls.ray_loss(cls.get_pos(tx), (x, y))
+
+    @classmethod
+    def loss_matrix(cls, tx_nodes, rx_nodes):
+        "get_loss() of every rx x tx pair"
+        loss = np.zeros((len(rx_nodes), len(tx_nodes)))
+        if not len(cls.walls):
+            return loss
+        pos = np.array([cls.get_pos(rx) for rx in rx_nodes]).reshape(-1, 2)
+        idx = np.floor((pos - cls.origin) / cls.resolution).astype(int)
+        inside = (idx >= 0).all(axis=1) & (idx < cls.shape).all(axis=1)
+        rows = cls.get_rows()
+        for col, tx in enumerate(tx_nodes):
+            if cls.is_static(tx):
+                raster = cls.get_raster(tx)
+                loss[inside, col] = raster[idx[inside, 0], idx[inside, 1]]
+                far = np.flatnonzero(~inside)
+            else:
+                far = np.arange(len(rx_nodes))
+            p = np.array(cls.get_pos(tx))
+            for start in range(0, len(far), rows):
+                chunk = far[start:start + rows]
+                crossed = cls.crossings(p, pos[chunk], cls.walls)
+                loss[chunk, col] = crossed.dot(cls.losses)
+        return loss
+
+    @classmethod
+    def loss_points(cls, tx, xy):
+        """get_loss() from tx to many points, xy being a (..., 2) array.
+        Points outside of the plan are checked against every wall"""
+        xy = np.asarray(xy, dtype=float)
+        if not len(cls.walls):
+            return np.zeros(xy.shape[:-1])
+        rows = cls.get_rows()
+        idx = np.floor((xy - cls.origin) / cls.resolution).astype(int)
+        inside = (idx >= 0).all(axis=-1) & (idx < cls.shape).all(axis=-1)
+        flat = np.clip(idx[..., 0], 0, cls.shape[0] - 1) * cls.shape[1] + \
+            np.clip(idx[..., 1], 0, cls.shape[1] - 1)
+        loss = cls.get_raster(tx).ravel()[flat]
+        if inside.all():
+            return loss
+        outside = xy[~inside]
+        far = np.empty(len(outside))
+        p = np.array(cls.get_pos(tx))
+        for start in range(0, len(outside), rows):
+            crossed = cls.crossings(p, outside[start:start + rows], cls.walls)
+            far[start:start + rows] = crossed.dot(cls.losses)
+        loss[~inside] = far
+        return loss
@@ -1,19 +1,23 @@
 # author: Ramon Fontes (ramonrf@dca.fee.unicamp.br)
 
 
+import math
 import os
 import re
 import subprocess
 from time import sleep
 from sys import version_info as py_version_info
+from threading import Lock
 from six import string_types
 
 from mininet.log import error, debug
-from mn_wifi.devices import CustomRate
+from mn_wifi.devices import CustomRate, rateTable
 from mn_wifi.manetRoutingProtocols import manetProtocols
+from mn_wifi.propagationModels import propagationModel as ppm
+from mn_wifi.sinr import sinr
 from mn_wifi.wmediumdConnector import DynamicIntfRef, \
-    w_starter, SNRLink, w_txpower, w_pos, \
-    w_cst, w_server, ERRPROBLink, wmediumd_mode
+    w_starter, SNRLink, w_txpower, w_pos, w_gain, w_height, \
+    w_cst, w_server, w_medium, ERRPROBLink, wmediumd_mode
 
 
 class IntfWireless(object):
@@ -833,17 +837,60 @@ def configureWmediumd(cls, fading_coefficient, noise_threshold, stations,
                        wmediumd.txpowers, isnodeaps, propagation_model,
                        maclist)
 
+    @classmethod
+    def get_state(cls):
+        "Gets the current positions and txpowers of the interfaces"
+        cls.positions = []
+        cls.txpowers = []
+        set_interference()
+
+    @classmethod
+    def update_nodes(cls):
+        """Sends the position, txpower, antenna gain and antenna height of
+        every interface to wmediumd at once (interference mode)"""
+        cls.get_state()
+        updates = list(cls.positions)
+        updates += [w_txpower(txpower.staintf, int(txpower.sta_txpower))
+                    for txpower in cls.txpowers]
+        for node in cls.nodes:
+            for wlan in range(0, min(len(node.params['wlan']),
+                                     len(node.params['mac']))):
+                updates.append(w_gain(node.wmIface[wlan],
+                                      int(node.params['antennaGain'][wlan])))
+                updates.append(w_height(
+                    node.wmIface[wlan], int(node.params['antennaHeight'][wlan])))
+        w_server.update_batch(updates)
+
+    @classmethod
+    def restart(cls, propagation_model, noise_threshold):
+        """Starts wmediumd again with a new propagation model and the
+        current state of the nodes. Only wmediumd is restarted: the
+        interfaces, associations and links are kept"""
+        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
+            cls.get_state()
+        starter = w_medium if w_medium.media else w_starter
+        starter.restart(pos=cls.positions, txpowers=cls.txpowers,
+                        ppm=propagation_model,
+                        noise_threshold=noise_threshold)
+        Association.reset_snr_cache()
+        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
+            cls.update_nodes()
+
 
 class start_wmediumd(object):
     def __init__(cls, intfrefs, links, positions,
                  fading_coefficient, noise_threshold, txpowers, isnodeaps,
                  propagation_model, maclist):
 
-        w_starter.start(intfrefs, links, pos=positions,
-                        fading_coefficient=fading_coefficient,
-                        noise_threshold=noise_threshold,
-                        txpowers=txpowers, isnodeaps=isnodeaps,
-                        ppm=propagation_model, maclist=maclist)
+        if w_medium.ids:
+            starter = w_medium
+        else:
+            starter = w_starter
+        starter.start(intfrefs, links, pos=positions,
+                      fading_coefficient=fading_coefficient,
+                      noise_threshold=noise_threshold,
+                      txpowers=txpowers, isnodeaps=isnodeaps,
+                      ppm=propagation_model, maclist=maclist)
 
 
 class set_interference(object):
@@ -920,11 +967,13 @@ class wirelessLink(object):
     equationLatency = '(dist / 10)/2'
     equationBw = ' * (1.01 ** -dist)'
     ifb = False
+    rate_model = False  # rate and loss from the SNR and the PER tables
 
     def __init__(self, node, wlan=0, dist=0):
+        sinr_ = sinr.get(node, wlan) if sinr.enabled else None
         latency_ = self.getLatency(dist)
-        loss_ = self.getLoss(dist)
-        bw_ = self.getBW(node, wlan, dist)
+        loss_ = self.getLoss(dist, sinr_, node, wlan)
+        bw_ = self.getBW(node, wlan, dist, sinr_)
         self.config_tc(node, wlan, bw_, loss_, latency_)
 
     def getDelay(self, dist):
@@ -934,13 +983,44 @@ def getDelay(self, dist):
     def getLatency(self, dist):
         return eval(self.equationLatency)
 
-    def getLoss(self, dist):
-        return eval(self.equationLoss)
+    def get_snr(self, node, wlan, sinr_=None):
+        "SNR (or SINR) of the rate model, None if it is off or unknown"
+        rssi = node.params['rssi'][wlan]
+        if not self.rate_model or not rssi:
+            return None
+        return sinr_[0] if sinr_ else rssi - ppm.noise_threshold
+
+    def getLoss(self, dist, sinr_=None, node=None, wlan=0):
+        """sinr_: (SINR, SNR) of the link. Interference adds the loss of a
+        frame whose SINR is that low (1 / (1 + SINR)) compared to no
+        interference at all. With the rate model, the loss is the PER of
+        the MCS the link uses, as wmediumd would apply it"""
+        snr = self.get_snr(node, wlan, sinr_) if node else None
+        if snr is not None:
+            mcs = rateTable.get(node, wlan, snr)
+            if mcs:
+                return 100 * mcs[1]
+
+        loss = eval(self.equationLoss)
+        if sinr_:
+            loss += 100 * (1 / (1 + 10 ** (sinr_[0] / 10.0)) -
+                           1 / (1 + 10 ** (sinr_[1] / 10.0)))
+        return loss
+
+    def getBW(self, node, wlan, dist, sinr_=None):
+        """sinr_: (SINR, SNR) of the link. Interference scales the rate by
+        the ratio of the Shannon capacities with and without it"""
+        snr = self.get_snr(node, wlan, sinr_)
+        if snr is not None:
+            # the SNR (SINR) already accounts for the distance/interference
+            return max(CustomRate(node, wlan, snr).rate, 0.1)
 
-    def getBW(self, node, wlan, dist):
         # dist is used by eval
         custombw = CustomRate(node, wlan).rate
         rate = eval(str(custombw) + self.equationBw)
+        if sinr_:
+            rate *= math.log(1 + 10 ** (sinr_[0] / 10.0)) / \
+                math.log(1 + 10 ** (sinr_[1] / 10.0))
 
         if rate <= 0.0:
             rate = 0.1
@@ -1305,13 +1385,42 @@ def setPhysicalMeshIface(self, node, wlan, intf, channel, ssid):
 
 class Association(IntfWireless):
 
+    snr_hysteresis = 0  # dB the SNR must change by before being re-sent
+    snr_sent = {}  # (sta, ap) -> last SNR sent to wmediumd
+    snr_updates = 0  # SNR updates sent (each one covers both directions)
+    snr_suppressed = 0  # SNR updates not sent because nothing changed
+    snr_lock = Lock()  # the mobility and association threads send SNRs
+
     @classmethod
     def setSNRWmediumd(cls, sta, ap, snr):
         "Send SNR to wmediumd"
-        w_server.send_snr_update(SNRLink(sta.wmIface[0],
-                                         ap.wmIface[0], snr))
-        w_server.send_snr_update(SNRLink(ap.wmIface[0],
-                                         sta.wmIface[0], snr))
+        snr = int(snr)
+        with cls.snr_lock:
+            last = cls.snr_sent.get((sta, ap))
+            # a link going up or down (SNR crossing 0) is always sent
+            if last is not None and abs(snr - last) <= cls.snr_hysteresis \
+                    and (snr > 0) == (last > 0):
+                cls.snr_suppressed += 1
+                return
+            cls.snr_sent[(sta, ap)] = snr
+            cls.snr_updates += 1
+            # sent under the lock, so wmediumd gets the SNRs of a link in
+            # the order they are cached
+            server = w_server.get_server(sta.wmIface[0])
+            server.send_snr_update(SNRLink(sta.wmIface[0], ap.wmIface[0],
+                                           snr))
+            server.send_snr_update(SNRLink(ap.wmIface[0], sta.wmIface[0],
+                                           snr))
+
+    @classmethod
+    def reset_snr_cache(cls, counters=False):
+        """Forgets the SNRs sent so far (e.g. wmediumd was restarted), and
+        the counters if counters is True (e.g. the network was stopped)"""
+        with cls.snr_lock:
+            cls.snr_sent = {}
+            if counters:
+                cls.snr_updates = 0
+                cls.snr_suppressed = 0
 
     @classmethod
     def configureWirelessLink(cls, sta, ap, wlan, ap_wlan):
@@ -1,9 +1,12 @@
 """Mininet-WiFi: A simple networking testbed for Wireless OpenFlow/SDWN!
    author: Ramon Fontes (ramonrf@dca.fee.unicamp.br)"""
 
-from threading import Thread as thread
+from threading import Thread as thread, Condition, local
+from collections import deque
 from time import sleep, time
 import os
+from hashlib import sha1
+from tempfile import gettempdir
 import numpy as np
 from numpy.random import rand
 
@@ -11,7 +14,9 @@
 from mn_wifi.link import wirelessLink, Association
 from mn_wifi.associationControl import associationControl
 from mn_wifi.plot import plot2d, plot3d, plotGraph
-from mn_wifi.wmediumdConnector import w_cst, wmediumd_mode
+from mn_wifi.scheduler import clock, scheduler
+from mn_wifi.spatialIndex import gridIndex
+from mn_wifi.wmediumdConnector import w_cst, wmediumd_mode, w_server
 
 
 class mobility(object):
@@ -20,8 +25,17 @@ class mobility(object):
     stations = []
     mobileNodes = []
     ac = None  # association control method
+    ap_index = gridIndex()  # spatial index of cls.aps
+    engine = None  # associationEngine (batched link evaluation)
     pause_simulation = False
     allAutoAssociation = True
+    dirty = set()  # nodes whose links must be re-evaluated
+    dirty_cond = Condition()
+    max_rate = 10  # max link re-evaluations per second (0: no limit)
+    event_driven = False  # whether the wifiParameters thread is running
+    busy = False  # whether the wifiParameters thread is applying changes
+    tick = local()  # positions collected during a tick, per thread
+    tick_latency = deque(maxlen=1000)  # secs taken by each batch of pos
     thread_ = ''
     end_time = 0
     func = ['mesh', 'adhoc', 'its']
@@ -91,9 +105,75 @@ def calculate_diff_time(cls, node, time=0):
     @classmethod
     def set_pos(cls, node, pos):
         node.params['position'] = pos
+        if node in cls.ap_index:
+            cls.ap_index.update(node)
         if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE \
                 and mobility.thread_._keep_alive:
-            node.set_pos_wmediumd(pos)
+            pending = getattr(mobility.tick, 'pos', None)
+            if pending is not None:
+                pending[node] = pos
+            else:
+                node.set_pos_wmediumd(pos)
+        cls.set_dirty(node)
+
+    @classmethod
+    def begin_tick(cls):
+        "Positions set from now on are sent to wmediumd by end_tick()"
+        mobility.tick.pos = {}
+
+    @classmethod
+    def end_tick(cls):
+        "Sends the positions set during the tick to wmediumd at once"
+        pending = getattr(mobility.tick, 'pos', None)
+        mobility.tick.pos = None
+        if not pending:
+            return
+        positions = []
+        for node, pos in pending.items():
+            positions += node.get_pos_wmediumd(pos)
+        if positions:
+            t1 = time()
+            w_server.update_pos_batch(positions)
+            mobility.tick_latency.append(time() - t1)
+
+    @classmethod
+    def set_dirty(cls, node):
+        "Marks node so that its links get re-evaluated"
+        with mobility.dirty_cond:
+            mobility.dirty.add(node)
+            mobility.dirty_cond.notify_all()
+
+    @classmethod
+    def invalidate(cls, node):
+        "Drops the link state kept for node by the association engine"
+        if cls.engine:
+            cls.engine.invalidate(node)
+
+    @classmethod
+    def wakeup(cls):
+        "Wakes up the wifiParameters thread (e.g. when resuming)"
+        with mobility.dirty_cond:
+            mobility.dirty_cond.notify_all()
+
+    @classmethod
+    def wait_links(cls):
+        "Waits until the wifiParameters thread applied every change"
+        with mobility.dirty_cond:
+            while mobility.event_driven and not mobility.pause_simulation \
+                    and (mobility.dirty or mobility.busy):
+                mobility.dirty_cond.wait(0.5)
+
+    @classmethod
+    def wait_parameters(cls):
+        "Waits until the wifiParameters thread is done with its nodes"
+        with mobility.dirty_cond:
+            while mobility.event_driven and mobility.busy:
+                mobility.dirty_cond.wait(0.5)
+
+    @classmethod
+    def is_alive(cls):
+        "Whether the mobility thread must keep running"
+        return mobility.thread_._keep_alive
 
     @classmethod
     def set_wifi_params(cls):
@@ -150,8 +230,9 @@ def ap_out_of_range(cls, sta, ap, wlan, ap_wlan):
             sta.params['rssi'][wlan] = 0
 
     @classmethod
-    def ap_in_range(cls, sta, ap, wlan, dist):
-        rssi = sta.get_rssi(ap, wlan, dist)
+    def ap_in_range(cls, sta, ap, wlan, dist, rssi=None):
+        if rssi is None:
+            rssi = sta.get_rssi(ap, wlan, dist)
         sta.params['apsInRange'][ap] = rssi
         ap.params['stationsInRange'][sta] = rssi
         if ap == sta.params['associatedTo'][wlan]:
@@ -180,12 +261,17 @@ def check_in_range(cls, sta, ap, wlan, ap_wlan):
             return 1
 
     @classmethod
-    def set_handover(cls, sta, aps, wlan):
+    def set_handover(cls, sta, aps, wlan, links=None):
+        """:param links: ap -> (distance, rssi) already computed, e.g. by
+        the association engine"""
         for ap in aps:
-            dist = sta.get_distance_to(ap)
+            if links:
+                dist, rssi = links[ap]
+            else:
+                dist, rssi = sta.get_distance_to(ap), None
             for ap_wlan in range(len(ap.params['wlan'])):
                 cls.do_handover(sta, ap, wlan, ap_wlan)
-            cls.ap_in_range(sta, ap, wlan, dist)
+            cls.ap_in_range(sta, ap, wlan, dist, rssi)
 
     @classmethod
     def do_handover(cls, sta, ap, wlan, ap_wlan):
@@ -206,6 +292,7 @@ def configLinks(cls, node=None):
         from mn_wifi.node import AP
         if node:
             if isinstance(node, AP) or node in cls.aps:
+                cls.ap_index.update(node)
                 nodes = cls.stations
             else:
                 nodes = [node]
@@ -213,12 +300,64 @@ def configLinks(cls, node=None):
             nodes = cls.stations
         cls.configureLinks(nodes)
 
+    @classmethod
+    def get_stations_near(cls, ap):
+        "Stations which are or were in range of ap"
+        stations = []
+        for sta in cls.stations:
+            if 'position' not in sta.params:
+                continue
+            if sta in ap.params.get('stationsInRange', {}) or \
+                    sta.get_distance_to(ap) <= ap.params['range'][0]:
+                stations.append(sta)
+        return stations
+
+    @classmethod
+    def get_dirty(cls):
+        """Waits until some node is marked as dirty and returns the
+        stations whose links must be re-evaluated"""
+        with mobility.dirty_cond:
+            while (not mobility.dirty or mobility.pause_simulation) \
+                    and cls.thread_._keep_alive:
+                mobility.dirty_cond.wait(0.5)
+            dirty = list(mobility.dirty)
+            mobility.dirty.clear()
+            mobility.busy = True
+
+        aps = set(cls.aps)
+        stations = set(cls.stations) | set(cls.mobileNodes)
+        nodes = set()
+        for node in dirty:
+            if node in aps:
+                nodes.update(cls.get_stations_near(node))
+            elif node in stations and 'position' in node.params:
+                nodes.add(node)
+        return [node for node in stations - aps if node in nodes]
+
     @classmethod
     def parameters(cls):
         "Applies channel params and handover"
         mobileNodes = list(set(cls.mobileNodes) - set(cls.aps))
-        while cls.thread_._keep_alive:
-            cls.configureLinks(mobileNodes)
+        mobility.event_driven = True
+        try:
+            cls.configureLinks([node for node in mobileNodes
+                                if 'position' in node.params])
+            while cls.thread_._keep_alive:
+                nodes = cls.get_dirty()
+                t1 = time()
+                try:
+                    if nodes:
+                        cls.configureLinks(nodes)
+                finally:
+                    with mobility.dirty_cond:
+                        mobility.busy = False
+                        mobility.dirty_cond.notify_all()
+                if cls.max_rate:
+                    elapsed = time() - t1
+                    if elapsed < 1.0 / cls.max_rate:
+                        sleep(1.0 / cls.max_rate - elapsed)
+        finally:
+            mobility.event_driven = False
 
     @classmethod
     def associate_interference_mode(cls, node, ap, wlan, ap_wlan):
@@ -236,15 +375,37 @@ def associate_interference_mode(cls, node, ap, wlan, ap_wlan):
             ack = cls.check_in_range(node, ap, wlan, ap_wlan)
             return ack
 
+    @classmethod
+    def get_aps_nearby(cls, node, wlan):
+        """Gets the APs that may have node in range. APs left out are
+        known to be out of range, so only the side effect of
+        ap_out_of_range for unassociated stations needs to be applied"""
+        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE and \
+                ('bgscan_threshold' in node.params or
+                 'active_scan' in node.params):
+            return cls.aps
+        if cls.ap_index.is_stale(cls.aps):
+            cls.ap_index.build(cls.aps)
+        aps = cls.ap_index.query(node.params['position'])
+        associatedTo = node.params['associatedTo'][wlan]
+        if associatedTo in cls.ap_index and associatedTo not in aps:
+            aps.append(associatedTo)
+            aps.sort(key=cls.ap_index.order.get)
+        if len(aps) < len(cls.aps) and not associatedTo:
+            node.params['rssi'][wlan] = 0
+        return aps
+
     @classmethod
     def configureLinks(cls, nodes):
+        if cls.engine:
+            nodes = cls.engine.configure(nodes, mobility)
         for node in nodes:
             for wlan in range(len(node.params['wlan'])):
                 if node.func[wlan] == 'mesh' or node.func[wlan] == 'adhoc':
                     pass
                 else:
                     aps = []
-                    for ap in cls.aps:
+                    for ap in cls.get_aps_nearby(node, wlan):
                         for ap_wlan in range(len(ap.params['wlan'])):
                             if ap.func[ap_wlan] not in cls.func:
                                 if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
@@ -254,10 +415,10 @@ def configureLinks(cls, nodes):
                                 if ack and ap not in aps:
                                     aps.append(ap)
                     cls.set_handover(node, aps, wlan)
-        sleep(0.0001)
 
 
 class model(mobility):
+    interval = 0.5  # seconds between two steps of the mobility model
 
     def __init__(self, **kwargs):
         self.start_thread(**kwargs)
@@ -337,9 +498,8 @@ def models(self, stations=None, aps=None, stat_nodes=None, mob_nodes=None,
         else:
             raise Exception("Mobility Model not defined or doesn't exist!")
 
-        current_time = time()
-        while (time() - current_time) < kwargs['time']:
-            pass
+        if not clock.sleep(kwargs['time'], mobility.is_alive):
+            return
 
         self.start_mob_mod(mob, mob_nodes, draw)
 
@@ -348,7 +508,18 @@ def start_mob_mod(self, mob, nodes, draw):
         :param mob: mobility params
         :param nodes: list of nodes
         """
-        for xy in mob:
+        sched = scheduler(mobility.is_alive)
+        sched.add(clock.now(), self.move_nodes, sched, iter(mob), nodes, draw)
+        sched.run()
+
+    def move_nodes(self, sched, mob, nodes, draw):
+        "Moves nodes one step and registers the next one"
+        try:
+            xy = next(mob)
+        except StopIteration:
+            return
+        mobility.begin_tick()
+        try:
             for idx, node in enumerate(nodes):
                 pos = round(xy[idx][0], 2), \
                       round(xy[idx][1], 2), \
@@ -356,12 +527,15 @@ def start_mob_mod(self, mob, nodes, draw):
                 mobility.set_pos(node, pos)
                 if draw:
                     plot2d.update(node)
-            if draw:
-                plot2d.pause()
-            else:
-                sleep(0.5)
-            while mobility.pause_simulation:
-                pass
+        finally:
+            mobility.end_tick()
+        interval = self.interval
+        if draw:
+            plot2d.pause()
+            if not clock.stepped:
+                interval = 0  # as fast as the graph is drawn
+        sched.add(clock.now() + interval, self.move_nodes,
+                  sched, mob, nodes, draw)
 
 
 class tracked(mobility):
@@ -381,7 +555,9 @@ def start_thread(self, **kwargs):
 
     def configure(self, stations=None, aps=None, stat_nodes=None, mob_nodes=None,
                   ac_method=None, plotNodes=None, draw=False, final_time=10,
-                  **kwargs):
+                  trajectory_cache=None, **kwargs):
+        """:param trajectory_cache: directory where compiled trajectories
+        are kept across runs (True means the temp directory)"""
         if ac_method:
             mobility.ac = ac_method
 
@@ -407,18 +583,18 @@ def configure(self, stations=None, aps=None, stat_nodes=None, mob_nodes=None,
         except:
             info('Warning: running without GUI.\n')
 
+        if trajectory_cache is True:
+            trajectory_cache = gettempdir()
         for node in nodes:
             if hasattr(node, 'coord'):
-                self.set_coordinates(node)
+                self.set_coordinates(node, trajectory_cache)
         self.run(mob_nodes, plot, draw, **kwargs)
 
     def run(self, mob_nodes, plot, draw, init_time=0, reverse=False,
             repetitions=1, **kwargs):
 
         for rep in range(repetitions):
-            cont = True
-            t1 = time()
-            i = 1
+            t1 = clock.now()
             if reverse:
                 for node in mob_nodes:
                     if rep % 2 == 1 or (rep % 2 == 0 and rep > 0):
@@ -429,68 +605,58 @@ def run(self, mob_nodes, plot, draw, init_time=0, reverse=False,
                 node.matrix_id = 0
                 node.time = node.startTime
                 mobility.calculate_diff_time(node)
-            while cont:
-                t2 = time()
-                if (t2 - t1) > mobility.end_time:
-                    cont = False
-                    if rep == repetitions:
-                        mobility.thread_._keep_alive = False
-                if (t2 - t1) >= init_time:
-                    if t2 - t1 >= i:
-                        for node in mob_nodes:
-                            if (t2 - t1) >= node.startTime and node.time <= node.endTime:
-                                if hasattr(node, 'coord'):
-                                    node.matrix_id += 1
-                                    if node.matrix_id < len(node.points):
-                                        pos = node.points[node.matrix_id]
-                                    else:
-                                        pos = node.points[len(node.points) - 1]
-                                else:
-                                    pos = self.move_node(node)
-                                mobility.set_pos(node, pos)
-                                node.time += 1
-                            if draw:
-                                plot.update(node)
-                                if kwargs['max_z'] == 0:
-                                    plot2d.updateCircleRadius(node)
-                        plot.pause()
-                        i += 1
+                if not hasattr(node, 'coord'):
+                    self.set_linear_trajectory(node)
+            # one step per second, from init_time on
+            sched = scheduler(mobility.is_alive)
+            i = 1
+            while max(i, init_time) <= mobility.end_time:
+                sched.add(t1 + max(i, init_time), self.move_nodes,
+                          mob_nodes, max(i, init_time), plot, draw, kwargs)
+                i += 1
+            if not sched.run() or \
+                    not clock.sleep_until(t1 + mobility.end_time,
+                                          mobility.is_alive):
+                break
+
+    def move_nodes(self, mob_nodes, elapsed, plot, draw, kwargs):
+        """Moves nodes one step. elapsed is the time the step was scheduled
+        for, not the clock read again, which may be a rounding error off"""
+        mobility.begin_tick()
+        try:
+            for node in mob_nodes:
+                if elapsed >= node.startTime and node.time <= node.endTime:
+                    node.matrix_id += 1
+                    mobility.set_pos(node, self.move_node(node))
+                    node.time += 1
+                if draw:
+                    plot.update(node)
+                    if kwargs['max_z'] == 0:
+                        plot2d.updateCircleRadius(node)
+        finally:
+            mobility.end_tick()
+        plot.pause()
 
     def move_node(self, node):
-        x = round(node.params['position'][0], 2) + round(node.moveFac[0], 2)
-        y = round(node.params['position'][1], 2) + round(node.moveFac[1], 2)
-        z = round(node.params['position'][2], 2) + round(node.moveFac[2], 2)
-        return [x, y, z]
-
-    def get_total_displacement(self, node):
-        x, y, z = 0, 0, 0
-        for num, coord in enumerate(node.coord):
-            if num > 0:
-                c0 = node.coord[num].split(',')
-                c1 = node.coord[num-1].split(',')
-                x += abs(float(c0[0]) - float(c1[0]))
-                y += abs(float(c0[1]) - float(c1[1]))
-                z += abs(float(c0[2]) - float(c1[2]))
-        return (x, y, z)
-
-    def create_coordinate(self, node):
-        coord = []
-        init_pos = node.params['initPos']
-        fin_pos = node.params['finPos']
-        if hasattr(node, 'coord'):
-            for idx in range(len(node.coord) - 1):
-                coord.append([node.coord[idx], node.coord[idx + 1]])
-        else:
-            coord1 = '%s,%s,%s' % (init_pos[0], init_pos[1], init_pos[2])
-            coord2 = '%s,%s,%s' % (fin_pos[0], fin_pos[1], fin_pos[2])
-            coord.append([coord1, coord2])
-        return coord
-
-    def direction(self, p1, p2):
-        if p1 > p2:
-            return False
-        else:
-            return True
+        "Position of node at its current step"
+        return self.get_position_at(node, node.matrix_id)
+
+    @staticmethod
+    def get_position_at(node, t):
+        """Position of node t steps (seconds) after it started moving,
+        linearly interpolated from its trajectory"""
+        traj = node.trajectory
+        return [float(np.interp(t, traj[:, 0], traj[:, axis]))
+                for axis in (1, 2, 3)]
+
+    def set_linear_trajectory(self, node):
+        "Trajectory from initPos to finPos, moving moveFac per step"
+        steps = int(node.endTime - node.startTime) + 1
+        t = np.arange(steps + 1, dtype=float)
+        init_pos = np.array(node.params['initPos'], dtype=float)
+        move_fac = np.round(np.array(node.moveFac, dtype=float), 2)
+        pos = np.round(init_pos + t[:, np.newaxis] * move_fac, 2)
+        node.trajectory = np.column_stack((t, pos))
 
     def mob_time(self, node):
         t1 = node.startTime
@@ -500,57 +666,64 @@ def mob_time(self, node):
         t = t2 - t1
         return t
 
-    def get_points(self, node, x1, y1, z1, x2, y2, z2, total):
+    def get_waypoints(self, node):
+        if hasattr(node, 'coord'):
+            coord = node.coord
+        else:
+            coord = ['%s,%s,%s' % tuple(node.params['initPos']),
+                     '%s,%s,%s' % tuple(node.params['finPos'])]
+        return np.array([c.split(',') for c in coord], dtype=float)
+
+    def get_trajectory(self, waypoints, mob_time):
+        """Compiles waypoints into an array of (time, x, y, z) rows, one
+        per step. Each segment takes a share of mob_time proportional to
+        the share of the total displacement it covers"""
+        diff = waypoints[1:] - waypoints[:-1]
+        dif = np.abs(diff)
+        total = dif.sum(axis=0)
+        perc_dif = np.zeros(dif.shape)
+        np.divide(dif * 100, total, out=perc_dif, where=total != 0)
         points = []
-        perc_dif = []
-        ldelta = [0, 0, 0]
-        faxes = [x1, y1, z1]  # first reference point
-        laxes = [x2, y2, z2]  # last refence point
-        dif = [abs(x2-x1), abs(y2-y1), abs(z2-z1)]   # difference first and last axes
-        for n in dif:
-            if n != 0:
-                # we get the difference among axes to calculate the speed
-                perc_dif.append((n * 100) / total[dif.index(n)])
-            if n == 0:
-                perc_dif.append(0)
-        dmin = min(x for x in perc_dif if x != 0)
-        t = self.mob_time(node)  # node simulation time
-        dt = t * (dmin / 100)
-        for n in perc_dif:
-            if n != 0:
-                ldelta[perc_dif.index(n)] = dif[perc_dif.index(n)] / dt
-            else:
-                ldelta[perc_dif.index(n)] = 0
-
-        # direction of the node
-        dir = (self.direction(x1, x2),
-               self.direction(y1, y2),
-               self.direction(z1, z2))
-
-        for n in range(0, int(dt)):
-            for delta in ldelta:
-                if dir[ldelta.index(delta)]:
-                    if n < int(dt) - 1:
-                        faxes[ldelta.index(delta)] += delta
-                    else:
-                        faxes[ldelta.index(delta)] = laxes[ldelta.index(delta)]
-                else:
-                    if n < int(dt) - 1:
-                        faxes[ldelta.index(delta)] -= delta
-                    else:
-                        faxes[ldelta.index(delta)] = laxes[ldelta.index(delta)]
-            points.append((mobility.get_position(faxes)))
-        node.points += points
-
-    def set_coordinates(self, node):
-        coord = self.create_coordinate(node)
-        total = self.get_total_displacement(node)
-        node.points = []
-        for c in coord:
-            a0 = c[0].split(',')
-            a1 = c[1].split(',')
-            self.get_points(node, float(a0[0]), float(a0[1]), float(a0[2]),
-                            float(a1[0]), float(a1[1]), float(a1[2]), total)
+        for seg in range(len(diff)):
+            perc = perc_dif[seg][perc_dif[seg] != 0]
+            if not len(perc):
+                continue
+            dt = mob_time * (perc.min() / 100)
+            steps = int(dt)
+            if steps < 1:
+                continue
+            n = np.arange(1, steps + 1, dtype=float)[:, np.newaxis]
+            seg_points = waypoints[seg] + n * (diff[seg] / dt)
+            seg_points[-1] = waypoints[seg + 1]
+            points.append(seg_points)
+        if not points:
+            points = [waypoints[-1:]]
+        points = np.concatenate(points)
+        t = np.arange(len(points), dtype=float)
+        return np.column_stack((t, points))
+
+    def set_coordinates(self, node, cache=None):
+        """Sets node.trajectory from node.coord. If cache is a directory
+        compiled trajectories are kept there, keyed by coord and time"""
+        mob_time = self.mob_time(node)
+        waypoints = self.get_waypoints(node)
+        filename = None
+        if cache:
+            key = sha1(('%r %r' % (waypoints.tolist(), mob_time))
+                       .encode('utf-8')).hexdigest()
+            filename = os.path.join(cache, 'mn-wifi-trajectory-%s.npy' % key)
+            if os.path.exists(filename):
+                try:
+                    node.trajectory = np.load(filename)
+                    return
+                except (IOError, ValueError):
+                    pass
+        node.trajectory = self.get_trajectory(waypoints, mob_time)
+        if filename:
+            try:
+                np.save(filename, node.trajectory)
+            except (IOError, OSError):
+                debug('Unable to cache the trajectory of %s\n' % node.name)
 
 
 # coding: utf-8
@@ -39,6 +39,12 @@
 from mn_wifi.energy import Energy
 from mn_wifi.telemetry import parseData, telemetry as run_telemetry
 from mn_wifi.mobility import tracked as trackedMob, model as mobModel, mobility as mob
+from mn_wifi.associationEngine import associationEngine
+from mn_wifi.coverage import coverageMap
+from mn_wifi.sinr import sinr
+from mn_wifi.floorPlan import floorPlan
+from mn_wifi.shadowing import shadowing
+from mn_wifi.scheduler import clock
 from mn_wifi.plot import plot2d, plot3d, plotGraph
 from mn_wifi.module import module
 from mn_wifi.propagationModels import propagationModel
@@ -167,6 +173,7 @@ def __init__(self, topo=None, switch=OVSKernelSwitch,
         self.max_y = 100
         self.max_z = 0
         self.conn = {}
+        self.coverage = coverageMap()
         self.wlinks = []
         Mininet_wifi.init()  # Initialize Mininet if necessary
 
@@ -1271,11 +1278,64 @@ def get_mob_stat_nodes(self):
         self.mob_param['mob_nodes'] = mob_nodes
 
     def setPropagationModel(self, **kwargs):
-        "Set Propagation Model"
+        "Set Propagation Model (applied live once the network is built)"
         self.ppm_is_set = True
         kwargs['noise_threshold'] = self.noise_threshold
         kwargs['cca_threshold'] = self.cca_threshold
         self.propagation_model(**kwargs)
+        if self.built:
+            self.update_propagation_model()
+
+    def update_propagation_model(self):
+        """Applies the propagation model to the running network: the
+        signal ranges are computed again, wmediumd is given the model
+        (in interference mode, where it is restarted with it) and the
+        links of the stations are checked again. The simulation is paused
+        meanwhile, once the mobility and wifiParameters threads are done
+        with their current step"""
+        paused, clock_paused = mob.pause_simulation, clock.is_paused()
+        mob.pause_simulation = True
+        clock.pause()
+        try:
+            clock.wait_idle()
+            mob.wait_parameters()
+            self.apply_propagation_model()
+        finally:
+            mob.pause_simulation = paused
+            if not clock_paused:
+                clock.resume()
+            mob.wakeup()
+
+    def apply_propagation_model(self):
+        "See update_propagation_model"
+        if self.link == wmediumd and self.wmediumd_started:
+            if self.wmediumd_mode == interference:
+                wmediumd.restart(propagationModel, self.noise_threshold)
+            else:
+                Association.reset_snr_cache()
+
+        nodes = self.stations + self.aps + self.cars
+        for node in nodes:
+            if getattr(node, 'range', False) or 'model' in node.params:
+                continue
+            for wlan in range(0, len(node.params['wlan'])):
+                intf = node.params['wlan'][wlan]
+                node.params['range'][wlan] = node.getRange(intf=intf)
+
+        # the links were evaluated with the old model
+        sinr.reset()
+        if mob.engine:
+            mob.engine.last = {}
+        mob.aps = self.aps
+        mob.ap_index.build(mob.aps)  # its cells depend on the ranges
+        stations = [node for node in self.stations + self.cars
+                    if 'position' in node.params and 'link' not in node.params]
+        if mob.event_driven:
+            # the wifiParameters thread checks them once resumed
+            for node in stations:
+                mob.set_dirty(node)
+        else:
+            mob.configureLinks(stations)
 
     def configWirelessLinkStatus(self, src, dst, status):
 
@@ -1580,6 +1640,24 @@ def plotGraph(self, **kwargs):
             self.plot = plot3d
         cleanup_mnwifi.plot = self.plot
 
+    def coverageMap(self, resolution=1, z=None, filename=None,
+                    value='rssi'):
+        """best server RSSI/SINR of the APs over the plot area. The map is
+        only recomputed when an AP, the propagation model or the walls
+        change
+
+        :params resolution: distance between the cells (m)
+        :params z: height of the map, or list of heights (3D map)
+        :params filename: saves the map as a NumPy .npz file
+        :params value: what plotGraph shows: rssi or sinr"""
+        self.coverage.compute(self.aps, self.min_x, self.min_y, self.max_x,
+                              self.max_y, resolution, z)
+        if filename:
+            self.coverage.save(filename)
+        if self.draw and not issubclass(self.plot, plot3d):
+            self.plot.drawCoverage(self.coverage, value)
+        return self.coverage
+
     def checkDimension(self, nodes):
         try:
             for node in nodes:
@@ -1651,6 +1729,58 @@ def setAssociationCtrl(self, ac='ssf'):
         "set association control"
         mob.ac = ac  # backwards compatibility
 
+    def setAssociationEngine(self, enable=True):
+        """evaluate station x AP links in batch (NumPy) instead of pair
+        by pair. Recommended for thousands of nodes"""
+        mob.engine = associationEngine() if enable else None
+
+    def setFloorPlan(self, walls=None, filename=None, resolution=1):
+        """walls which attenuate the signal (indoors)
+
+        :params walls: list of (x1, y1, x2, y2, material), material being
+        glass, drywall, wood, brick, concrete, metal or a loss in dB
+        :params filename: file with a 'x1 y1 x2 y2 material' line per wall
+        :params resolution: cell size (m) of the precomputed losses"""
+        if filename:
+            floorPlan.load(filename, resolution=resolution)
+        else:
+            floorPlan.setWalls(walls or [], resolution=resolution)
+
+    def setMedia(self, *args, **kwargs):
+        """Several wireless media, each one with its own wmediumd, are not
+        supported: the bundled wmediumd always listens on the same socket
+        and mac80211_hwsim lets a single wmediumd register per network
+        namespace, the one every radio is created in"""
+        raise Exception('setMedia: several wireless media need a wmediumd '
+                        'and radios per network namespace, which the '
+                        'bundled wmediumd and mac80211_hwsim do not support')
+
+    def setSINRModel(self, enable=True):
+        """without wmediumd, shapes the station links with their SINR,
+        taking the APs on the same and adjacent channels into account"""
+        if enable:
+            sinr.enable(self.aps)
+        else:
+            sinr.disable()
+
+    def setRateModel(self, enable=True):
+        """without wmediumd, the rate and loss of the station links are the
+        rate and PER of the best MCS at their SNR, from the PER tables of
+        mn_wifi/data. The width, streams and sgi params (or ht_capab) of
+        the stations and APs set the channel width, spatial streams and
+        guard interval"""
+        wirelessLink.rate_model = enable
+
+    def setSNRHysteresis(self, hysteresis=0):
+        """SNR mode: only send an SNR to wmediumd when it changed by more
+        than hysteresis dB since the last one sent for the same link"""
+        Association.snr_hysteresis = hysteresis
+
+    def setReevaluationRate(self, rate=10):
+        """set the max number of link re-evaluations per second done
+        by the association thread (0 means no limit)"""
+        mob.max_rate = rate
+
     def useExternalProgram(self, program, **kwargs):
         """Opens an external program
 
@@ -1831,15 +1961,34 @@ def propagation_model(**kwargs):
         "Propagation Model Attr"
         propagationModel.setAttr(**kwargs)
 
+    @staticmethod
+    def setClock(scale=1, stepped=False):
+        """Configures the simulation clock driving mobility and replaying
+
+        :params scale: simulation seconds per wall clock second
+        :params stepped: time only advances through step()"""
+        clock.set_scale(scale)
+        clock.set_stepped(stepped)
+
+    @staticmethod
+    def step(dt=1):
+        """Advances the simulation by dt seconds (stepped clock) and waits
+        until positions, links and tc updates due meanwhile are applied"""
+        clock.step(dt)
+        mob.wait_links()
+
     @staticmethod
     def stop_simulation():
         "Pause the simulation"
         mob.pause_simulation = True
+        clock.pause()
 
     @staticmethod
     def start_simulation():
         "Start the simulation"
         mob.pause_simulation = False
+        clock.resume()
+        mob.wakeup()
 
     @staticmethod
     def setChannelEquation(**params):
@@ -1872,6 +2021,9 @@ def stopGraphParams():
     def closeMininetWiFi(self):
         "Close Mininet-WiFi"
         cleanup_mnwifi.kill_mod_proc()
+        clock.reset()
+        Association.reset_snr_cache(counters=True)
+        shadowing.reset()
 
 
 class MininetWithControlWNet(Mininet_wifi):
@@ -190,7 +190,13 @@ def wpa_pexec(self, pidfile, intf, wlan):
     def configLinks(self):
         "Applies channel params and handover"
         from mn_wifi.mobility import mobility
-        mobility.configLinks(self)
+        mobility.invalidate(self)
+        if mobility.event_driven:
+            if isinstance(self, AP):
+                mobility.ap_index.update(self)
+            mobility.set_dirty(self)
+        else:
+            mobility.configLinks(self)
 
     def getMAC(self, intf):
         "get Mac Address of any Interface"
@@ -339,15 +345,22 @@ def get_rssi(self, node=None, wlan=0, dist=0):
         value = propagationModel(self, node, dist, wlan)
         return float(value.rssi)
 
-    def set_pos_wmediumd(self, pos):
-        "Set Position for wmediumd"
+    def get_pos_wmediumd(self, pos):
+        "w_pos of each wlan, or none if the position did not change"
+        positions = []
         wlans = len(self.params['mac'])
         if self.lastpos != pos:
             self.lastpos = pos
             for wlan in range(0, wlans):
                 inc = '%s' % float('0.'+str(wlan))
-                w_server.update_pos(w_pos(self.wmIface[wlan],
-                    [(float(pos[0])+float(inc)), float(pos[1]), float(pos[2])]), True)
+                positions.append(w_pos(self.wmIface[wlan],
+                    [(float(pos[0])+float(inc)), float(pos[1]), float(pos[2])]))
+        return positions
+
+    def set_pos_wmediumd(self, pos):
+        "Set Position for wmediumd"
+        for w_pos_ in self.get_pos_wmediumd(pos):
+            w_server.update_pos(w_pos_, True)
 
     def setGainWmediumd(self, wlan):
         "Set Antenna Gain for wmediumd"
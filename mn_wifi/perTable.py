@@ -0,0 +1,56 @@
+"""Mininet-WiFi: A simple networking testbed for Wireless OpenFlow/SDWN!
+
+   RSSI x bitrate -> PER tables of mn_wifi/data, the ones wmediumd is
+   given with -x. Every table is parsed once into NumPy arrays, which
+   rateTable (devices.py) reads the rates and PER of its MCS from."""
+
+import numpy as np
+
+
+class perTable(object):
+    "PER tables of mn_wifi/data"
+
+    noise = -91  # noise floor the tables were made with (dBm)
+    default = 'signal_table_ieee80211ax'
+    grid = np.arange(-100, -39)  # RSSI (dBm) of the curves of rateTable
+    tables = {}  # name -> (RSSI, rates, PER)
+
+    @classmethod
+    def get_name(cls, mode, width=20, sgi=False):
+        "Table of a mode, channel width (MHz) and guard interval"
+        if mode in ['a', 'b', 'g']:
+            return cls.default
+        return 'signal_table_ieee80211n_%sgi%d' % ('s' if sgi else '',
+                                                   40 if width >= 40 else 20)
+
+    @classmethod
+    def load(cls, name):
+        import pkg_resources
+        filename = pkg_resources.resource_filename('mn_wifi',
+                                                   'data/%s' % name)
+        rates, rows = [], []
+        with open(filename) as file_:
+            for line in file_:
+                values = line.split()
+                if values[:2] == ['#', 'bitrate']:
+                    rates = [float(rate.replace('Mbps', ''))
+                             for rate in values[2:]]
+                elif values and values[0] != '#':
+                    rows.append([float(value) for value in values])
+        rows = np.array(rows)
+        rssi, per = rows[:, 0], rows[:, 1:]
+        # a few values of the tables are not probabilities: they are
+        # interpolated from the ones around them
+        for col in per.T:
+            bad = (col < 0) | (col > 1)
+            if bad.any():
+                col[bad] = np.interp(rssi[bad], rssi[~bad], col[~bad])
+        cls.tables[name] = (rssi, np.array(rates), per)
+
+    @classmethod
+    def read(cls, name=None):
+        "RSSI (dBm), rates (Mbps) and PER (RSSI x rate) of a table"
+        name = name or cls.default
+        if name not in cls.tables:
+            cls.load(name)
+        return cls.tables[name]
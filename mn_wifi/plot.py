@@ -137,6 +137,7 @@ class plot2d (object):
     'Plot 2d Graphs'
     ax = None
     lines = {}
+    coverage = None
 
     @classmethod
     def closePlot(cls):
@@ -248,6 +249,20 @@ def set_def_color(cls, node):
     def instantiateAnnotate(cls, node):
         node.plttxt = cls.ax.annotate(node, xy=(0, 0))
 
+    @classmethod
+    def drawCoverage(cls, coverage, value='rssi'):
+        "Draws a coverage map (the lowest height of it) below the nodes"
+        data = getattr(coverage, value)
+        if data.ndim == 3:
+            data = data[0]
+        if cls.coverage:
+            cls.coverage.remove()
+        cls.coverage = cls.ax.imshow(
+            np.where(np.isfinite(data), data, np.nan), origin='lower',
+            extent=coverage.extent, aspect='auto', alpha=0.5, zorder=0,
+            interpolation='nearest', cmap='viridis')
+        cls.draw()
+
     @classmethod
     def updateCircleRadius(cls, node):
         node.pltCircle.set_radius(max(node.params['range']))
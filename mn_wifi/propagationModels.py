@@ -9,8 +9,55 @@
                 Two-Ray-Ground Propagation Model"""
 
 import math
-from random import gauss
-from time import sleep
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+from mn_wifi.floorPlan import floorPlan
+from mn_wifi.shadowing import shadowing
+
+
+class pathLossTable(object):
+    """Free space path loss per (frequency, system loss). The loss at the
+    reference distance (1 m) is computed once per channel"""
+
+    tables = {}  # (freq, L) -> loss at 1 m
+
+    @staticmethod
+    def compute(freq, dist, L):
+        "Path loss (dB) at dist meters of a signal of freq GHz"
+        f = freq * 10 ** 9  # Convert Ghz to Hz
+        c = 299792458.0
+        lambda_ = c / f  # lambda: wavelength (m)
+        denominator = lambda_ ** 2
+        numerator = (4 * math.pi * dist) ** 2 * L
+        return 10 * math.log10(numerator / denominator)
+
+    @classmethod
+    def clear(cls):
+        cls.tables = {}
+
+    @classmethod
+    def get_table(cls, freq, L):
+        "Loss at 1 m of (freq, L), computed on the first use of a channel"
+        loss = cls.tables.get((freq, L))
+        if loss is None:
+            loss = cls.tables[(freq, L)] = cls.compute(freq, 1, L)
+        return loss
+
+    @classmethod
+    def loss(cls, freq, dist, L):
+        "Same as compute(), the reference loss coming from the table"
+        if dist == 1:
+            return cls.get_table(freq, L)
+        return cls.compute(freq, dist, L)
+
+    @staticmethod
+    def compute_array(freq, dists, L):
+        "compute() over a NumPy array of distances"
+        lambda_ = 299792458.0 / (freq * 10 ** 9)
+        return 10 * np.log10((4 * math.pi * dists) ** 2 * L / lambda_ ** 2)
 
 
 class propagationModel(object):
@@ -27,14 +74,71 @@ class propagationModel(object):
     variance = 2 # variance
     noise_threshold = -91
     cca_threshold = -90
+    models = {}  # name -> functions of the model (see register)
+    current = {}  # functions of the current model
+    current_name = ''
+    version = 0  # changes whenever the attributes change
 
     def __init__(self, node1=None, node2=None, dist=0, wlan=0):
-        if self.model in dir(self):
-            self.__getattribute__(self.model)(node1=node1, node2=node2,
-                                              dist=dist, wlan=wlan)
+        func = self.get_model().get('rssi')
+        if func:
+            self.rssi = func(self, node1=node1, node2=node2, dist=dist,
+                             wlan=wlan)
+            if len(floorPlan.walls):
+                self.rssi -= floorPlan.get_loss(node2, node1)
+
+    @classmethod
+    def get_model(cls):
+        "Functions of the current model, looked up once per model change"
+        if cls.current_name != cls.model:
+            cls.current = cls.models.get(cls.model, {})
+            cls.current_name = cls.model
+        return cls.current
+
+    @classmethod
+    def register(cls, name, rssi, signal_range=None, txpower=None,
+                 matrix=None, cache=True):
+        """Registers a custom propagation model, which can then be set with
+        setPropagationModel(model=name)
+
+        :param rssi: rssi(node1, node2, dist, wlan), RSSI received by
+        wlan of node1 from node2
+        :param signal_range: signal_range(node, wlan), range of the signal
+        :param txpower: txpower(node, wlan, dist), txpower giving a signal
+        range of dist
+        :param matrix: matrix(tx_nodes, rx_nodes, distances, wlans), RSSI
+        of many links at once, as returned by rssi_matrix
+        :param cache: whether signal_range and txpower only depend on the
+        txpower, gain and frequency of the node and may be cached"""
+        model = {'rssi': lambda self, **kwargs: rssi(
+            kwargs['node1'], kwargs['node2'], kwargs['dist'], kwargs['wlan']),
+                 'cache': cache}
+        if signal_range:
+            model['range'] = lambda self, **kwargs: signal_range(
+                kwargs['node'], kwargs['wlan'])
+        if txpower:
+            model['txpower'] = lambda self, **kwargs: txpower(
+                kwargs['node'], kwargs['wlan'], kwargs['dist'])
+        if matrix:
+            model['matrix'] = matrix
+        cls.models[name] = model
+        cls.current_name = None
+        cls.version += 1
+
+    @classmethod
+    def register_builtin(cls, name, cache=True):
+        "Registers a model implemented by the classes of this module"
+        model = {'rssi': vars(cls)[name], 'matrix': cls.builtin_matrix,
+                 'cache': cache}
+        if name in vars(GetSignalRange):
+            model['range'] = vars(GetSignalRange)[name]
+        if name in vars(GetPowerGivenRange):
+            model['txpower'] = vars(GetPowerGivenRange)[name]
+        cls.models[name] = model
 
     @classmethod
     def setAttr(cls, **kwargs):
+        cls.version += 1
         cls.model = 'logDistance'
         if 'model' in kwargs:
             cls.model = kwargs['model']
@@ -54,6 +158,12 @@ def setAttr(cls, **kwargs):
             cls.noise_threshold = kwargs['noise_threshold']
         if 'cca_threshold' in kwargs:
             cls.cca_threshold = kwargs['cca_threshold']
+        shadowing.setAttr(seed=kwargs.get('seed'), sigma=cls.variance,
+                          d_corr=kwargs.get('d_corr'))
+        pathLossTable.clear()
+        cls.get_model()
+        GetSignalRange.cache.clear()
+        GetPowerGivenRange.cache.clear()
 
     def pathLoss(self, node1, dist, wlan):
         """Path Loss Model:
@@ -61,19 +171,15 @@ def pathLoss(self, node1, dist, wlan):
         (d) is the distance between the transmitter and the receiver (m)
         (c) speed of light in vacuum (m)
         (L) System loss"""
-        f = node1.params['freq'][wlan] * 10 ** 9  # Convert Ghz to Hz
-        c = 299792458.0
-        L = self.sL
+        return self.getPathLoss(node1.params['freq'][wlan], dist)
 
+    @classmethod
+    def getPathLoss(cls, freq, dist):
+        "Path loss (dB, truncated) at dist meters of a signal of freq GHz"
         if dist == 0:
             dist = 0.1
 
-        lambda_ = c / f  # lambda: wavelength (m)
-        denominator = lambda_ ** 2
-        numerator = (4 * math.pi * dist) ** 2 * L
-        pl = 10 * math.log10(numerator / denominator)
-
-        return int(pl)
+        return int(pathLossTable.loss(freq, dist, cls.sL))
 
     def friis(self, **kwargs):
         """Friis Propagation Loss Model:
@@ -143,11 +249,12 @@ def logNormalShadowing(self, **kwargs):
         exponent: The exponent of the Path Loss propagation model, where 2
         is for propagation in free space
         (d) is the distance between the transmitter and the receiver (m)
-        gRandom is a Gaussian random variable"""
+        gRandom is a Gaussian random variable, drawn for each link"""
         gr = kwargs['node1'].params['antennaGain'][kwargs['wlan']]
         pt = kwargs['node2'].params['txpower'][0]
         gt = kwargs['node2'].params['antennaGain'][0]
-        gRandom = self.gRandom
+        gRandom = shadowing.link(kwargs['node1'], kwargs['wlan'],
+                                 kwargs['node2'])
         gains = pt + gt + gr
         ref_d = 1
 
@@ -206,19 +313,232 @@ def young(self, **kwargs):
 
         return self.rssi
 
+    @classmethod
+    def rssi_matrix(cls, tx_nodes, rx_nodes, distances, wlan=0):
+        """RSSI of many links at once, equal to the values given by
+        propagationModel(rx, tx, dist, wlan) one link at a time.
+        distances[i][j] is the distance between rx_nodes[i] and
+        tx_nodes[j]. wlan is the wlan of the receivers, either a single
+        index or one per receiver. Returns a len(rx_nodes) x len(tx_nodes)
+        array of floats"""
+        dist = np.array(distances, dtype=float).reshape(len(rx_nodes),
+                                                        len(tx_nodes))
+        model = cls.get_model()
+        if 'rssi' not in model:
+            return np.full(dist.shape, float(cls.rssi))
+        if not isinstance(wlan, (list, tuple)):
+            wlan = [wlan] * len(rx_nodes)
+        if 'matrix' not in model:
+            return np.array([[float(cls(rx, tx, dist[i, j], wlan[i]).rssi)
+                              for j, tx in enumerate(tx_nodes)]
+                             for i, rx in enumerate(rx_nodes)]
+                            ).reshape(dist.shape)
+
+        rssi = np.asarray(model['matrix'](tx_nodes, rx_nodes, dist, wlan),
+                          dtype=float)
+        rssi = np.broadcast_to(rssi, dist.shape).astype(float)
+        if len(floorPlan.walls):
+            rssi -= floorPlan.loss_matrix(tx_nodes, rx_nodes)
+        return rssi
+
+    @classmethod
+    def builtin_matrix(cls, tx_nodes, rx_nodes, dist, wlan):
+        "rssi_matrix of the models implemented here (walls excluded)"
+
+        def rx_param(key):
+            return np.array([float(node.params[key][wlan_])
+                             for node, wlan_ in zip(rx_nodes, wlan)]
+                            ).reshape(-1, 1)
+
+        def tx_param(key):
+            return np.array([float(node.params[key][0])
+                             for node in tx_nodes]).reshape(1, -1)
+
+        kwargs = dict(dist=np.where(dist == 0, 0.1, dist),
+                      gr=rx_param('antennaGain'), gt=tx_param('antennaGain'))
+        if cls.model in ('twoRayGround', 'young'):
+            kwargs['hr'] = rx_param('antennaHeight')
+            kwargs['ht'] = tx_param('antennaHeight')
+        if cls.model != 'young':
+            kwargs['pt'] = tx_param('txpower')
+            # the reference loss only depends on the frequency
+            freqs = [node.params['freq'][wlan_]
+                     for node, wlan_ in zip(rx_nodes, wlan)]
+            kwargs['freq'] = rx_param('freq')
+            kwargs['pl'] = np.array([float(cls.getPathLoss(freq, 1))
+                                     for freq in freqs]).reshape(-1, 1)
+        if cls.model == 'logNormalShadowing':
+            kwargs['gRandom'] = np.array(
+                [[shadowing.link(rx, wlan_, tx) for tx in tx_nodes]
+                 for rx, wlan_ in zip(rx_nodes, wlan)]).reshape(dist.shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return getattr(cls, cls.model + '_matrix')(**kwargs)
+
+    @classmethod
+    def rssi_field(cls, tx, dist, gr=5.0, hr=1.0):
+        """RSSI at the distances dist (an array of any shape) from tx, for
+        receivers with antenna gain gr and height hr on the channel of tx.
+        Used to map coverage. logNormalShadowing gives its mean value"""
+        dist = np.asarray(dist, dtype=float)
+        model = cls.get_model()
+        freq = tx.params['freq'][0]
+        if 'rssi' not in model:
+            return np.full(dist.shape, float(cls.rssi))
+        if model.get('matrix') != cls.builtin_matrix:
+            rx = probeNode(gr, hr, freq)
+            rssi = [model['rssi'](cls, node1=rx, node2=tx, dist=d, wlan=0)
+                    for d in dist.ravel()]
+            return np.array(rssi, dtype=float).reshape(dist.shape)
+
+        params = tx.params
+        kwargs = dict(dist=np.where(dist == 0, 0.1, dist), gr=float(gr),
+                      hr=float(hr), freq=np.array(float(freq)),
+                      pl=float(cls.getPathLoss(freq, 1)), gRandom=0,
+                      pt=float(params['txpower'][0]),
+                      gt=float(params['antennaGain'][0]),
+                      ht=float(params['antennaHeight'][0]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rssi = getattr(cls, cls.model + '_matrix')(**kwargs)
+        return np.broadcast_to(rssi, dist.shape).astype(float)
+
+    @classmethod
+    def friis_matrix(cls, **kwargs):
+        gains = kwargs['pt'] + kwargs['gt'] + kwargs['gr']
+        shape = np.broadcast(gains, kwargs['dist']).shape
+        d = np.broadcast_to(kwargs['dist'], shape)
+        freqs = kwargs['freq']
+        if freqs.size == 1:
+            pl = pathLossTable.compute_array(freqs.item(), d, cls.sL)
+        else:
+            freqs = np.broadcast_to(freqs, shape)
+            pl = np.empty(shape)
+            for freq in np.unique(freqs):
+                mask = freqs == freq
+                pl[mask] = pathLossTable.compute_array(freq, d[mask], cls.sL)
+        return gains - np.trunc(pl)
+
+    @classmethod
+    def twoRayGround_matrix(cls, **kwargs):
+        d = kwargs['dist']
+        pt, gt, gr = kwargs['pt'], kwargs['gt'], kwargs['gr']
+        gains = pt + gt + gr
+        pldb = (pt * gt * gr * kwargs['ht'] ** 2 * kwargs['hr'] ** 2) / \
+               (d ** 4 * cls.sL)
+        return gains - np.trunc(pldb)
+
+    @classmethod
+    def logDistance_matrix(cls, **kwargs):
+        gains = kwargs['pt'] + kwargs['gt'] + kwargs['gr']
+        pldb = 10 * cls.exp * np.log10(kwargs['dist'] / 1)
+        return gains - (kwargs['pl'] + np.trunc(pldb))
+
+    @classmethod
+    def logNormalShadowing_matrix(cls, **kwargs):
+        gains = kwargs['pt'] + kwargs['gt'] + kwargs['gr']
+        pldb = 10 * cls.exp * np.log10(kwargs['dist'] / 1) + \
+               kwargs['gRandom']
+        return gains - (kwargs['pl'] + np.trunc(pldb))
+
+    @classmethod
+    def ITU_matrix(cls, **kwargs):
+        d = kwargs['dist']
+        gains = kwargs['pt'] + kwargs['gt'] + kwargs['gr']
+        N = np.where(d > 16, 38, 28)
+        if cls.pL != 0:
+            N = cls.pL
+        f = kwargs['freq'] * 10 ** 3
+        pldb = 20 * np.log10(f) + N * np.log10(d) + \
+               cls.lF * cls.nFloors - 28
+        return gains - np.trunc(pldb)
+
+    @classmethod
+    def young_matrix(cls, **kwargs):
+        cf = 0.01075  # clutter factor
+        return np.trunc(kwargs['dist'] ** 4 / (kwargs['gt'] * kwargs['gr']) *
+                        (kwargs['ht'] * kwargs['hr']) ** 2 * cf)
+
+
+class probeNode(object):
+    "Receiver of rssi_field, standing for the stations of a coverage map"
+
+    def __init__(self, gr, hr, freq):
+        self.name = 'probe'
+        self.params = {'antennaGain': [gr], 'antennaHeight': [hr],
+                       'freq': [freq], 'wlan': ['probe-wlan0'],
+                       'position': (0, 0, 0)}
+
 
 ppm = propagationModel
 
 
+class lruCache(object):
+    """Least recently used cache of the range/txpower inversions, used by
+    the plot and mobility threads at once"""
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    @staticmethod
+    def get_key(node, wlan, *args):
+        """Everything the inversion of the current model depends on, or
+        None if the result cannot be cached (it is random)"""
+        if not ppm.get_model().get('cache', True):
+            return None
+        params = node.params
+        key = (ppm.model, ppm.exp, ppm.sL, ppm.lF, ppm.pL, ppm.nFloors,
+               ppm.noise_threshold, params['txpower'][wlan],
+               params['antennaGain'][wlan], params['freq'][wlan]) + args
+        if ppm.model == 'twoRayGround':
+            rssi = params['rssi'][wlan] if 'rssi' in params else -60
+            key += (params['antennaHeight'][wlan], rssi)
+        return key
+
+    def get(self, key):
+        with self.lock:
+            if key is None or key not in self.data:
+                self.misses += 1
+                return None
+            value = self.data.pop(key)
+            self.data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if key is None:
+            return
+        with self.lock:
+            self.data[key] = value
+            if len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
 class GetSignalRange(object):
 
     dist = 0
+    cache = lruCache()
 
     def __init__(self, node=None, wlan=0, enable_interference=False):
         "Calculate the signal range given the propagation model"
-        if ppm.model in dir(self):
-            self.__getattribute__(ppm.model)(node=node, wlan=wlan,
-                                             interference=enable_interference)
+        func = ppm.get_model().get('range')
+        if func:
+            key = self.cache.get_key(node, wlan)
+            dist = self.cache.get(key)
+            if dist is None:
+                dist = func(self, node=node, wlan=wlan,
+                            interference=enable_interference)
+                self.cache.set(key, dist)
+            self.dist = dist
 
     def friis(self, **kwargs):
         """Path Loss Model:
@@ -247,15 +567,7 @@ def pathLoss(self, node, dist, wlan):
         (d) is the distance between the transmitter and the receiver (m)
         (c) speed of light in vacuum (m)
         (L) System loss"""
-        f = node.params['freq'][wlan] * 10 ** 9  # Convert Ghz to Hz
-        c = 299792458.0
-        L = ppm.sL
-        lambda_ = c / f  # lambda: wavelength (m)
-        denominator = lambda_ ** 2
-        numerator = (4 * math.pi * dist) ** 2 * L
-        pl = 10 * math.log10(numerator / denominator)
-
-        return pl
+        return pathLossTable.loss(node.params['freq'][wlan], dist, ppm.sL)
 
     def twoRayGround(self, **kwargs):
         """Two Ray Ground Propagation Loss Model (does not give a good result for
@@ -296,23 +608,14 @@ def logDistance(self, **kwargs):
     
     def logNormalShadowing(self, **kwargs):
         """Log-Normal Shadowing Propagation Loss Model"""
-        from mn_wifi.wmediumdConnector import WmediumdGRandom, w_server
-
         ref_d = 1
         txpower = kwargs['node'].params['txpower'][kwargs['wlan']]
         gain = kwargs['node'].params['antennaGain'][kwargs['wlan']]
         gains = txpower + (gain * 2)
-        mean = 0
-        variance = propagationModel.variance
-        gRandom = round(gauss(mean, variance), 2)
+        gRandom = shadowing.get_gRandom(kwargs['node'], kwargs['wlan'],
+                                        kwargs['interference'])
         propagationModel.gRandom = gRandom
 
-        if kwargs['interference']:
-            sleep(0.002) #notice problem when there are multiple threads
-            w_server.update_gaussian_random(
-                WmediumdGRandom(kwargs['node'].wmIface[kwargs['wlan']],
-                                gRandom))
-
         pl = self.pathLoss(kwargs['node'], ref_d, kwargs['wlan']) - gRandom
         numerator = -ppm.noise_threshold - pl + gains
         denominator = 10 * ppm.exp
@@ -340,12 +643,19 @@ def ITU(self, **kwargs):
 class GetPowerGivenRange(object):
     "Get tx power when the signal range is set"
     txpower = 0
+    cache = lruCache()
 
     def __init__(self, node, wlan, dist, enable_interference):
         "Calculate txpower given the signal range"
-        if ppm.model in dir(self):
-            self.__getattribute__(ppm.model)(node=node, wlan=wlan, dist=dist,
-                                             interference=enable_interference)
+        func = ppm.get_model().get('txpower')
+        if func:
+            key = self.cache.get_key(node, wlan, dist)
+            txpower = self.cache.get(key)
+            if txpower is None:
+                txpower = func(self, node=node, wlan=wlan, dist=dist,
+                               interference=enable_interference)
+                self.cache.set(key, txpower)
+            self.txpower = txpower
 
     def friis(self, **kwargs):
         """Path Loss Model:
@@ -376,15 +686,7 @@ def pathLoss(self, node, dist, wlan):
         (d) is the distance between the transmitter and the receiver (m)
         (c) speed of light in vacuum (m)
         (L) System loss"""
-        f = node.params['freq'][wlan] * 10 ** 9  # Convert Ghz to Hz
-        c = 299792458.0
-        L = ppm.sL
-        lambda_ = c / f  # lambda: wavelength (m)
-        denominator = lambda_ ** 2
-        numerator = (4 * math.pi * dist) ** 2 * L
-        pl = 10 * math.log10(numerator / denominator)
-
-        return pl
+        return pathLossTable.loss(node.params['freq'][wlan], dist, ppm.sL)
 
     def twoRayGround(self, **kwargs):
         """Two Ray Ground Propagation Loss Model (does not give a good result for
@@ -435,21 +737,13 @@ def logDistance(self, **kwargs):
     def logNormalShadowing(self, **kwargs):
         """Log-Normal Shadowing Propagation Loss Model
         distance is the range of the transmitter (m)"""
-        from mn_wifi.wmediumdConnector import WmediumdGRandom, w_server
-
-        mean = 0
         d = kwargs['dist']
         ref_d = 1
         gain = kwargs['node'].params['antennaGain'][kwargs['wlan']]
-        variance = propagationModel.variance
-        gRandom = round(gauss(mean, variance), 2)
+        gRandom = shadowing.get_gRandom(kwargs['node'], kwargs['wlan'],
+                                        kwargs['interference'])
         propagationModel.gRandom = gRandom
 
-        if kwargs['interference']:
-            sleep(0.001)  # notice problem when there are many threads
-            w_server.update_gaussian_random(WmediumdGRandom(
-                kwargs['node'].wmIface[kwargs['wlan']], gRandom))
-
         pl = self.pathLoss(kwargs['node'], ref_d, kwargs['wlan']) - gRandom
 
         self.txpower = 10 * ppm.exp * math.log10(d / ref_d) + \
@@ -475,3 +769,9 @@ def ITU(self, **kwargs):
             self.txpower = 1
 
         return self.txpower
+
+
+for name in ['friis', 'logDistance', 'ITU', 'twoRayGround', 'young']:
+    ppm.register_builtin(name)
+# a new Gaussian value is drawn as nodes move
+ppm.register_builtin('logNormalShadowing', cache=False)
@@ -12,8 +12,10 @@
 from mininet.log import info
 from mn_wifi.plot import plot2d, plot3d
 from mn_wifi.mobility import mobility
+from mn_wifi.scheduler import clock, scheduler
 from mn_wifi.link import wirelessLink
 from mn_wifi.node import Station, AP
+from mn_wifi.propagationModels import pathLossTable
 
 
 class replayingMobility(object):
@@ -55,6 +57,7 @@ def mobility(self, nodes, Mininet_wifi):
                 if 'position' in node.params and node not in mobility.aps:
                     mobility.aps.append(node)
 
+        plot = None
         if Mininet_wifi.draw:
             Mininet_wifi.isReplaying=False
             Mininet_wifi.checkDimension(nodes)
@@ -62,7 +65,7 @@ def mobility(self, nodes, Mininet_wifi):
             if Mininet_wifi.max_z != 0:
                 plot = plot3d
 
-        currentTime = time()
+        currentTime = clock.now()
         for node in nodes:
             if 'speed' not in node.params:
                 node.params['speed'] = 1.0
@@ -75,20 +78,32 @@ def mobility(self, nodes, Mininet_wifi):
         if self.timestamp:
             calc_pos = self.timestamp_
 
-        while mobility.thread_._keep_alive:
-            time_ = time() - currentTime
-            if len(nodes) == 0:
-                break
-            for node in nodes:
-                if hasattr(node, 'position'):
-                    calc_pos(node, time_)
-                    if len(node.position) == 0:
-                        nodes.remove(node)
-                    mobility.configLinks()
-                    if Mininet_wifi.draw:
-                        plot.update(node)
-            if Mininet_wifi.draw:
-                plot.pause()
+        sched = scheduler(mobility.is_alive)
+        for node in nodes:
+            if hasattr(node, 'position') and len(node.position) > 0:
+                due = self.get_next_time(node)
+                sched.add(currentTime + due, self.replay, sched, node,
+                          calc_pos, currentTime, due, plot)
+        sched.run(plot.pause if plot else None)
+
+    def get_next_time(self, node):
+        "Time at which node must move next"
+        if self.timestamp:
+            return float(node.time[0])
+        return node.currentTime
+
+    def replay(self, sched, node, calc_pos, currentTime, due, plot):
+        """Moves node. due is the time (since currentTime) the event was
+        scheduled for: the clock, read again, may differ from it by a
+        rounding error and leave the position where it is"""
+        calc_pos(node, due)
+        mobility.configLinks(node)
+        if plot:
+            plot.update(node)
+        if len(node.position) > 0:
+            due = self.get_next_time(node)
+            sched.add(currentTime + due, self.replay, sched, node,
+                      calc_pos, currentTime, due, plot)
 
     @classmethod
     def addNode(cls, node):
@@ -113,26 +128,24 @@ def __init__(self, Mininet_wifi):
 
     @classmethod
     def throughput(cls, Mininet_wifi):
-        currentTime = time()
-        stations = Mininet_wifi.stations
-        while mobility.thread_._keep_alive:
-            if len(stations) == 0:
-                break
-            time_ = time() - currentTime
-            for sta in stations:
-                if hasattr(sta, 'time'):
-                    if time_ >= sta.time[0]:
-                        wirelessLink.config_tc(sta, 0, sta.throughput[0], 0, 0)
-                        # pos = '%d, %d, %d' % (sta.throughput[0], sta.throughput[0], 0)
-                        # self.moveStationTo(sta, pos)
-                        del sta.throughput[0]
-                        del sta.time[0]
-                        #info('%s\n' % sta.time[0])
-                    if len(sta.time) == 1:
-                        stations.remove(sta)
-            # time.sleep(0.001)
+        currentTime = clock.now()
+        sched = scheduler(mobility.is_alive)
+        for sta in Mininet_wifi.stations:
+            if hasattr(sta, 'time') and len(sta.time) > 1:
+                sched.add(currentTime + float(sta.time[0]), cls.set_throughput,
+                          sched, sta, currentTime)
+        sched.run()
         info("\nReplaying Process Finished!")
 
+    @classmethod
+    def set_throughput(cls, sched, sta, currentTime):
+        wirelessLink.config_tc(sta, 0, sta.throughput[0], 0, 0)
+        del sta.throughput[0]
+        del sta.time[0]
+        if len(sta.time) > 1:
+            sched.add(currentTime + float(sta.time[0]), cls.set_throughput,
+                      sched, sta, currentTime)
+
 
 class replayingNetworkConditions(object):
     'Replaying Network Conditions'
@@ -149,33 +162,34 @@ def __init__(self, Mininet_wifi, **kwargs):
     def behavior(cls, Mininet_wifi):
         seconds = 5
         info('Replaying process starting in %s seconds\n' % seconds)
-        sleep(seconds)
+        if not clock.sleep(seconds, mobility.is_alive):
+            return
         info('Replaying process has been started\n')
-        currentTime = time()
-        stations = Mininet_wifi.stations
-        for sta in stations:
+        currentTime = clock.now()
+        sched = scheduler(mobility.is_alive)
+        for sta in Mininet_wifi.stations:
             sta.params['freq'][0] = sta.get_freq(0)
-        while mobility.thread_._keep_alive:
-            if len(stations) == 0:
-                break
-            time_ = time() - currentTime
-            for sta in stations:
-                if hasattr(sta, 'time'):
-                    if time_ >= sta.time[0]:
-                        if sta.params['associatedTo'][0] != '':
-                            bw = sta.bw[0]
-                            loss = sta.loss[0]
-                            latency = sta.latency[0]
-                            wirelessLink.config_tc(sta, 0, bw, loss, latency)
-                        del sta.bw[0]
-                        del sta.loss[0]
-                        del sta.latency[0]
-                        del sta.time[0]
-                    if len(sta.time) == 0:
-                        stations.remove(sta)
-            sleep(0.001)
+            if hasattr(sta, 'time') and len(sta.time) > 0:
+                sched.add(currentTime + float(sta.time[0]), cls.set_conditions,
+                          sched, sta, currentTime)
+        sched.run()
         info('Replaying process has finished!')
 
+    @classmethod
+    def set_conditions(cls, sched, sta, currentTime):
+        if sta.params['associatedTo'][0] != '':
+            bw = sta.bw[0]
+            loss = sta.loss[0]
+            latency = sta.latency[0]
+            wirelessLink.config_tc(sta, 0, bw, loss, latency)
+        del sta.bw[0]
+        del sta.loss[0]
+        del sta.latency[0]
+        del sta.time[0]
+        if len(sta.time) > 0:
+            sched.add(currentTime + float(sta.time[0]), cls.set_conditions,
+                      sched, sta, currentTime)
+
     @classmethod
     def addNode(cls, node):
         if isinstance(node, Station):
@@ -237,8 +251,9 @@ def rssi(self, Mininet_wifi, propagationModel='', n=0):
     def setPos(cls, Mininet_wifi, sta, ap, dist, ang):
         x = float('%.2f' % (dist * cos(ang) + int(ap.params['position'][0])))
         y = float('%.2f' % (dist * sin(ang) + int(ap.params['position'][1])))
-        sta.params['position'] = x, y, 0
-        mobility.configLinks(sta)
+        mobility.set_pos(sta, (x, y, 0))
+        if not mobility.event_driven:
+            mobility.configLinks(sta)
         if Mininet_wifi.draw:
             try:
                 plot2d.update(sta)
@@ -263,17 +278,11 @@ def pathLoss(cls, sta, ap, dist, wlan=0):
         (d) is the distance between the transmitter and the receiver (m)
         (c) speed of light in vacuum (m)
         (L) System loss"""
-        f = sta.params['freq'][wlan] * 10 ** 9  # Convert Ghz to Hz
-        c = 299792458.0
         L = 1
         if dist == 0:
             dist = 0.1
-        lambda_ = c / f  # lambda: wavelength (m)
-        denominator = lambda_ ** 2
-        numerator = (4 * math.pi * dist) ** 2 * L
-        pathLoss_ = 10 * math.log10(numerator / denominator)
 
-        return pathLoss_
+        return pathLossTable.loss(sta.params['freq'][wlan], dist, L)
 
     @classmethod
     def friis(cls, sta, ap, pT, gT, gR, signalLevel, n):
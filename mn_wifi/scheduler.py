@@ -0,0 +1,212 @@
+"""Mininet-WiFi: A simple networking testbed for Wireless OpenFlow/SDWN!
+
+   Simulation clock shared by the threads which drive the simulation
+   (mobility, replaying) and a heap of timed events. Threads sleep until
+   their next event is due instead of polling time(). The clock may run
+   faster than real time or be stepped manually for batch experiments."""
+
+from heapq import heappush, heappop
+from itertools import count
+from threading import Condition, current_thread
+from time import time
+
+
+class clock(object):
+    """Simulation clock. By default it follows the wall clock, optionally
+    scaled (scale=10 runs 10x faster than real time). In stepped mode time
+    only advances through step(). Time does not advance while paused"""
+
+    cond = Condition()
+    virtual = 0.0  # simulation time at the last rebase
+    wall = time()  # wall time at the last rebase
+    scale = 1.0
+    paused = False
+    stepped = False
+    sleepers = {}  # thread -> simulation time it waits for (stepped mode)
+    threads = {}   # thread -> number of nested users of the clock
+    max_wait = 0.5  # how often sleepers check whether they are still alive
+
+    @classmethod
+    def now(cls):
+        "Simulation time, in seconds"
+        with cls.cond:
+            if cls.paused or cls.stepped:
+                return cls.virtual
+            return cls.virtual + (time() - cls.wall) * cls.scale
+
+    @classmethod
+    def rebase(cls):
+        with cls.cond:
+            cls.virtual = cls.now()
+            cls.wall = time()
+
+    @classmethod
+    def reset(cls):
+        "Back to time 0, following the wall clock, as a new network expects"
+        with cls.cond:
+            cls.virtual = 0.0
+            cls.wall = time()
+            cls.scale = 1.0
+            cls.paused = False
+            cls.stepped = False
+            cls.sleepers.clear()
+            cls.cond.notify_all()
+
+    @classmethod
+    def is_paused(cls):
+        return cls.paused
+
+    @classmethod
+    def pause(cls):
+        with cls.cond:
+            cls.rebase()
+            cls.paused = True
+            cls.cond.notify_all()
+
+    @classmethod
+    def resume(cls):
+        with cls.cond:
+            cls.rebase()
+            cls.paused = False
+            cls.cond.notify_all()
+
+    @classmethod
+    def set_scale(cls, scale):
+        "Simulation seconds per wall clock second"
+        if scale <= 0:
+            raise ValueError('the time scale must be greater than 0')
+        with cls.cond:
+            cls.rebase()
+            cls.scale = float(scale)
+            cls.cond.notify_all()
+
+    @classmethod
+    def set_stepped(cls, stepped=True):
+        "In stepped mode time only advances through step()"
+        with cls.cond:
+            cls.rebase()
+            cls.stepped = stepped
+            cls.sleepers.clear()
+            cls.cond.notify_all()
+
+    @classmethod
+    def join(cls):
+        "Tells step() that the current thread is driven by the clock"
+        me = current_thread()
+        with cls.cond:
+            cls.threads[me] = cls.threads.get(me, 0) + 1
+
+    @classmethod
+    def leave(cls):
+        me = current_thread()
+        with cls.cond:
+            cls.threads[me] -= 1
+            if not cls.threads[me]:
+                del cls.threads[me]
+            cls.cond.notify_all()
+
+    @classmethod
+    def sleep_until(cls, t, alive=None):
+        """Blocks until the clock reaches t (and is not paused).
+        Returns False if alive() becomes False meanwhile"""
+        me = current_thread()
+        with cls.cond:
+            cls.join()
+            try:
+                while alive is None or alive():
+                    if cls.stepped:
+                        if cls.virtual >= t:
+                            return True
+                        cls.sleepers[me] = t
+                        cls.cond.notify_all()
+                        cls.cond.wait(cls.max_wait)
+                    elif cls.paused:
+                        cls.sleepers[me] = t
+                        cls.cond.notify_all()
+                        cls.cond.wait(cls.max_wait)
+                        cls.sleepers.pop(me, None)
+                    else:
+                        remaining = (t - cls.now()) / cls.scale
+                        if remaining <= 0:
+                            return True
+                        cls.cond.wait(min(remaining, cls.max_wait))
+                return False
+            finally:
+                cls.sleepers.pop(me, None)
+                cls.leave()
+
+    @classmethod
+    def sleep(cls, secs, alive=None):
+        "Same as time.sleep, but in simulation time"
+        return cls.sleep_until(cls.now() + secs, alive)
+
+    @classmethod
+    def wait_idle(cls):
+        "Waits until every thread driven by the clock is sleeping on it"
+        with cls.cond:
+            while True:
+                for thread_ in list(cls.threads):
+                    if not thread_.is_alive():
+                        del cls.threads[thread_]
+                if all(thread_ in cls.sleepers for thread_ in cls.threads):
+                    return
+                cls.cond.wait(cls.max_wait)
+
+    @classmethod
+    def step(cls, dt):
+        """Advances the clock by dt seconds (switching to stepped mode),
+        waking up the sleepers in time order. Returns once every event
+        due within dt has been run"""
+        with cls.cond:
+            if not cls.stepped:
+                cls.set_stepped()
+            end = cls.virtual + dt
+            while True:
+                cls.wait_idle()
+                due = [t for t in cls.sleepers.values() if t <= end]
+                if not due:
+                    break
+                cls.virtual = max(cls.virtual, min(due))
+                for thread_, t in list(cls.sleepers.items()):
+                    if t <= cls.virtual:
+                        del cls.sleepers[thread_]
+                cls.cond.notify_all()
+            cls.virtual = end
+            cls.cond.notify_all()
+
+
+class scheduler(object):
+    "Timed events run, in time order, by the thread calling run()"
+
+    def __init__(self, alive=None):
+        """:param alive: callable telling whether the thread must keep
+        running (e.g. lambda: mobility.thread_._keep_alive)"""
+        self.events = []  # heap of (time, seq, func, args)
+        self.seq = count()
+        self.alive = alive
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, t, func, *args):
+        "Registers func(*args) to run when the clock reaches t"
+        heappush(self.events, (t, next(self.seq), func, args))
+
+    def run(self, after=None):
+        """Runs the events until there is none left. Events may register
+        new ones. after() is called once per batch of events due at the
+        same time. Returns False if the thread was told to stop"""
+        clock.join()
+        try:
+            while self.events:
+                if not clock.sleep_until(self.events[0][0], self.alive):
+                    return False
+                now = clock.now()
+                while self.events and self.events[0][0] <= now:
+                    _, _, func, args = heappop(self.events)
+                    func(*args)
+                if after:
+                    after()
+            return True
+        finally:
+            clock.leave()
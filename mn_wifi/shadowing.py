@@ -0,0 +1,141 @@
+"""Mininet-WiFi: A simple networking testbed for Wireless OpenFlow/SDWN!
+
+   Per link shadowing of the Log-Normal Shadowing propagation model.
+   Every link (and every interface, for the values sent to wmediumd) has
+   its own Gaussian sample. Samples are reproducible: the random numbers
+   come from a hash of the seed, the link and the number of draws, so they
+   do not depend on the order links are evaluated in. A new sample is only
+   drawn when an end of the link moves, and it is correlated with the
+   previous one over the distance moved (Gudmundson model)."""
+
+import math
+import struct
+from hashlib import sha1
+from threading import RLock
+
+import numpy as np
+
+
+class shadowing(object):
+    "Shadowing samples, one row per link of the state array"
+
+    seed = 0
+    sigma = 2.0  # standard deviation (dB)
+    d_corr = 20.0  # decorrelation distance (m)
+    index = {}  # link key -> row
+    sent = {}  # interface -> sample last sent to wmediumd
+    # sample, draws, position of both ends
+    state = np.zeros((0, 8))
+    SAMPLE, DRAWS, POS1, POS2 = 0, 1, slice(2, 5), slice(5, 8)
+    lock = RLock()
+
+    @classmethod
+    def setAttr(cls, seed=None, sigma=None, d_corr=None):
+        "Changes the parameters and forgets every sample"
+        if seed is not None:
+            cls.seed = seed
+        if sigma is not None:
+            cls.sigma = float(sigma)
+        if d_corr is not None:
+            cls.d_corr = float(d_corr)
+        cls.reset()
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.index = {}
+            cls.sent = {}
+            cls.state = np.zeros((0, 8))
+
+    @classmethod
+    def clear_sent(cls):
+        "Forgets the samples sent to wmediumd (e.g. it was restarted)"
+        with cls.lock:
+            cls.sent = {}
+
+    @classmethod
+    def normal(cls, key, draw):
+        "Standard normal number of the draw-th draw of key"
+        digest = sha1(('%s|%s|%d' % (cls.seed, key, draw)).encode()).digest()
+        u1, u2 = struct.unpack('!II', digest[:8])
+        u1 = (u1 + 1.0) / 4294967296.0  # (0, 1]
+        u2 = u2 / 4294967296.0
+        return math.sqrt(-2 * math.log(u1)) * math.cos(2 * math.pi * u2)
+
+    @staticmethod
+    def get_pos(node):
+        pos = node.params.get('position', (0, 0, 0))
+        return [float(pos[0]), float(pos[1]), float(pos[2])]
+
+    @staticmethod
+    def get_intf(node, wlan):
+        if 'wlan' in node.params:
+            return node.params['wlan'][wlan]
+        return '%s-%s' % (node.name, wlan)
+
+    @classmethod
+    def sample(cls, key, pos1, pos2):
+        "Sample of key given the current position of its ends"
+        with cls.lock:
+            return cls.__sample(key, pos1, pos2)
+
+    @classmethod
+    def __sample(cls, key, pos1, pos2):
+        row = cls.index.get(key)
+        if row is None:
+            row = len(cls.index)
+            if row == len(cls.state):
+                grown = np.zeros((max(2 * row, 64), 8))
+                grown[:row] = cls.state
+                cls.state = grown
+            cls.index[key] = row
+            state = cls.state[row]
+            state[cls.SAMPLE] = cls.sigma * cls.normal(key, 0)
+            state[cls.DRAWS] = 1
+            state[cls.POS1] = pos1
+            state[cls.POS2] = pos2
+            return round(state[cls.SAMPLE], 2)
+
+        state = cls.state[row]
+        moved = np.linalg.norm(state[cls.POS1] - pos1) + \
+                np.linalg.norm(state[cls.POS2] - pos2)
+        if moved > 0:
+            rho = math.exp(-moved / cls.d_corr)
+            draws = int(state[cls.DRAWS])
+            state[cls.SAMPLE] = rho * state[cls.SAMPLE] + \
+                math.sqrt(1 - rho ** 2) * cls.sigma * cls.normal(key, draws)
+            state[cls.DRAWS] = draws + 1
+            state[cls.POS1] = pos1
+            state[cls.POS2] = pos2
+        return round(state[cls.SAMPLE], 2)
+
+    @classmethod
+    def link(cls, node1, wlan1, node2, wlan2=0):
+        "Sample of the link between two interfaces (the same both ways)"
+        ends = sorted([(cls.get_intf(node1, wlan1), node1),
+                       (cls.get_intf(node2, wlan2), node2)],
+                      key=lambda end: end[0])
+        key = '%s|%s' % (ends[0][0], ends[1][0])
+        return cls.sample(key, cls.get_pos(ends[0][1]),
+                          cls.get_pos(ends[1][1]))
+
+    @classmethod
+    def intf(cls, node, wlan):
+        "Sample of an interface, as used by wmediumd"
+        return cls.sample(cls.get_intf(node, wlan), cls.get_pos(node),
+                          [0, 0, 0])
+
+    @classmethod
+    def get_gRandom(cls, node, wlan, interference=False):
+        """Sample of an interface, sent to wmediumd (in interference mode)
+        whenever it changes"""
+        from mn_wifi.wmediumdConnector import WmediumdGRandom, w_server
+
+        with cls.lock:
+            gRandom = cls.intf(node, wlan)
+            key = cls.get_intf(node, wlan)
+            if interference and cls.sent.get(key) != gRandom:
+                w_server.update_gaussian_random(
+                    WmediumdGRandom(node.wmIface[wlan], gRandom))
+                cls.sent[key] = gRandom
+        return gRandom
@@ -0,0 +1,166 @@
+"""Mininet-WiFi: A simple networking testbed for Wireless OpenFlow/SDWN!
+
+   SINR of the station links when wmediumd is not used. The power each
+   station interface receives from every AP comes from the batch RSSI
+   matrix and is kept in a station x AP array, along with its sum per
+   AP frequency (weighted by how much the channels overlap). When a node
+   moves or changes txpower/channel only its row (station) or column (AP)
+   is computed again and the sums are updated from the difference. A new
+   propagation model or floor plan drops every value."""
+
+import math
+from threading import RLock
+
+import numpy as np
+
+from mn_wifi.floorPlan import floorPlan
+from mn_wifi.propagationModels import propagationModel as ppm
+
+
+class sinr(object):
+    "Interference of same and adjacent channel APs"
+
+    enabled = False
+    aps = []    # transmitters (columns)
+    size = 0    # len(aps) when the columns were built
+    col = {}    # ap -> column
+    row = {}    # (station, wlan) -> row
+    state = {}  # node or (station, wlan) -> state the values are valid for
+    version = None  # model and walls the values were computed with
+    freqs = []  # AP frequencies (columns of sums)
+    weight = np.zeros((0, 0))  # AP x frequency overlap
+    power = np.zeros((0, 0))   # mW received by row from column
+    sums = np.zeros((0, 0))    # power of the row per frequency
+    # part of the power of a 20 MHz channel seen 0, 5, 10 and 15 MHz away
+    overlap = [1, 0.7, 0.35, 0.1]
+    lock = RLock()  # of the arrays above, used by several threads
+
+    @classmethod
+    def enable(cls, aps):
+        "Estimates the SINR of the stations associated to aps"
+        cls.enabled = True
+        cls.aps = aps
+        cls.reset()
+
+    @classmethod
+    def disable(cls):
+        cls.enabled = False
+        cls.reset()
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.size = -1
+            cls.row = {}
+            cls.state = {}
+            cls.power = np.zeros((0, 0))
+
+    @classmethod
+    def get_overlap(cls, freq1, freq2):
+        "Part of the power sent at freq1 (GHz) seen at freq2"
+        step = int(round(abs(freq1 - freq2) * 1000 / 5.0))
+        return cls.overlap[step] if step < len(cls.overlap) else 0
+
+    @staticmethod
+    def get_state(node, wlan=0):
+        params = node.params
+        return (tuple(float(p) for p in params.get('position', ())),
+                params['txpower'][wlan], params['antennaGain'][wlan],
+                params['freq'][wlan])
+
+    @staticmethod
+    def get_pos(nodes):
+        return np.array([[float(p) for p in
+                          node.params.get('position', (0, 0, 0))]
+                         for node in nodes], dtype=float).reshape(-1, 3)
+
+    @classmethod
+    def build(cls):
+        "(Re)builds the columns, forgetting every row"
+        with cls.lock:
+            cls.version = cls.get_version()
+            cls.size = len(cls.aps)
+            cls.col = dict((ap, idx) for idx, ap in enumerate(cls.aps))
+            cls.freqs = sorted(set(ap.params['freq'][0] for ap in cls.aps))
+            cls.weight = np.array([[cls.get_overlap(ap.params['freq'][0], freq)
+                                    for freq in cls.freqs] for ap in cls.aps]
+                                  ).reshape(len(cls.aps), len(cls.freqs))
+            cls.state = dict((ap, cls.get_state(ap)) for ap in cls.aps)
+            cls.row = {}
+            cls.power = np.zeros((0, len(cls.aps)))
+            cls.sums = np.zeros((0, len(cls.freqs)))
+
+    @classmethod
+    def received(cls, aps, rows):
+        "mW received by the (station, wlan) rows from aps"
+        stas = [sta for sta, _ in rows]
+        diff = cls.get_pos(stas)[:, np.newaxis, :] - \
+            cls.get_pos(aps)[np.newaxis, :, :]
+        dist = np.round(np.sqrt((diff ** 2).sum(axis=2)), 2)
+        rssi = ppm.rssi_matrix(aps, stas, dist, [wlan for _, wlan in rows])
+        return 10 ** (rssi / 10.0)
+
+    @staticmethod
+    def get_version():
+        return ppm.version, floorPlan.version
+
+    @classmethod
+    def refresh_aps(cls):
+        "Updates the columns of the APs which changed"
+        with cls.lock:
+            if cls.size != len(cls.aps) or cls.version != cls.get_version():
+                return cls.build()
+            changed = [ap for ap in cls.aps
+                       if cls.get_state(ap) != cls.state[ap]]
+            if not changed:
+                return
+            if any(ap.params['freq'][0] != cls.state[ap][3] for ap in changed):
+                return cls.build()
+            keys = sorted(cls.row, key=cls.row.get)
+            for ap in changed:
+                cls.state[ap] = cls.get_state(ap)
+                if not keys:
+                    continue
+                col = cls.col[ap]
+                new = cls.received([ap], keys)[:, 0]
+                cls.sums += np.outer(new - cls.power[:, col], cls.weight[col])
+                cls.power[:, col] = new
+
+    @classmethod
+    def refresh_row(cls, sta, wlan):
+        "Updates the row of (sta, wlan) if the station changed"
+        with cls.lock:
+            key = (sta, wlan)
+            state = cls.get_state(sta, wlan)
+            if key in cls.row and cls.state[key] == state:
+                return cls.row[key]
+            if key not in cls.row:
+                cls.row[key] = len(cls.power)
+                cls.power = np.vstack([cls.power, np.zeros(len(cls.aps))])
+                cls.sums = np.vstack([cls.sums, np.zeros(len(cls.freqs))])
+            row = cls.row[key]
+            cls.power[row] = cls.received(cls.aps, [key])[0]
+            cls.sums[row] = cls.power[row].dot(cls.weight)
+            cls.state[key] = state
+            return row
+
+    @classmethod
+    def get(cls, sta, wlan, ap=None):
+        """(SINR, SNR) in dB of the link between (sta, wlan) and ap (the
+        AP sta is associated to by default), or None if unknown"""
+        if ap is None:
+            ap = sta.params['associatedTo'][wlan]
+        if not cls.enabled or 'position' not in sta.params:
+            return None
+        with cls.lock:
+            cls.refresh_aps()
+            if ap not in cls.col:
+                return None
+            row = cls.refresh_row(sta, wlan)
+            col = cls.col[ap]
+            signal = cls.power[row, col]
+            freq = cls.freqs.index(ap.params['freq'][0])
+            interference = max(cls.sums[row, freq] - signal, 0)
+        noise = 10 ** (ppm.noise_threshold / 10.0)
+        snr = 10 * math.log10(signal / noise)
+        return snr - 10 * math.log10(1 + interference / noise), snr
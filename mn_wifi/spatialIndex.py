@@ -0,0 +1,95 @@
+"""Mininet-WiFi: A simple networking testbed for Wireless OpenFlow/SDWN!
+
+   Uniform grid over node positions. The cell size is the largest signal
+   range among the indexed nodes, so every node whose range covers a given
+   point lives in the cell of that point or in one of its neighbours."""
+
+from math import floor
+
+
+class gridIndex(object):
+    "Spatial index of nodes (usually APs) keyed by grid cell"
+
+    def __init__(self, nodes=None):
+        self.nodes = None  # list the index was built from
+        self.size = 0      # len(self.nodes) at build time
+        self.cell_size = 1.0
+        self.cells = {}    # cell -> list of nodes
+        self.where = {}    # node -> cell
+        self.order = {}    # node -> index in self.nodes
+        self.unplaced = [] # nodes without position (always candidates)
+        if nodes is not None:
+            self.build(nodes)
+
+    def __contains__(self, node):
+        return node in self.order
+
+    @staticmethod
+    def get_range(node):
+        return float(node.params['range'][0])
+
+    def is_stale(self, nodes):
+        "Whether the index must be rebuilt to reflect nodes"
+        return self.nodes is not nodes or self.size != len(nodes)
+
+    def get_cell(self, pos):
+        cs = self.cell_size
+        return (int(floor(float(pos[0]) / cs)),
+                int(floor(float(pos[1]) / cs)),
+                int(floor(float(pos[2]) / cs)))
+
+    def build(self, nodes):
+        "(Re)builds the index from scratch"
+        self.nodes = nodes
+        self.size = len(nodes)
+        self.cells = {}
+        self.where = {}
+        self.unplaced = []
+        self.order = dict((node, idx) for idx, node in enumerate(nodes))
+        ranges = [self.get_range(node) for node in nodes
+                  if 'range' in node.params]
+        self.cell_size = max(ranges + [1.0])
+        for node in nodes:
+            self.insert(node)
+
+    def insert(self, node):
+        if 'position' not in node.params or 'range' not in node.params:
+            self.unplaced.append(node)
+            return
+        cell = self.get_cell(node.params['position'])
+        self.cells.setdefault(cell, []).append(node)
+        self.where[node] = cell
+
+    def remove(self, node):
+        cell = self.where.pop(node, None)
+        if cell is not None:
+            self.cells[cell].remove(node)
+            if not self.cells[cell]:
+                del self.cells[cell]
+        elif node in self.unplaced:
+            self.unplaced.remove(node)
+
+    def update(self, node):
+        "Called when node moves or its range changes"
+        if node not in self.order:
+            return
+        if 'range' in node.params and \
+                self.get_range(node) > self.cell_size:
+            self.build(self.nodes)
+            return
+        self.remove(node)
+        self.insert(node)
+
+    def query(self, pos):
+        """Returns the nodes whose range may cover pos, in the same order
+        they appear in the indexed list"""
+        cx, cy, cz = self.get_cell(pos)
+        cells = self.cells
+        found = list(self.unplaced)
+        for x in (cx - 1, cx, cx + 1):
+            for y in (cy - 1, cy, cy + 1):
+                for z in (cz - 1, cz, cz + 1):
+                    if (x, y, z) in cells:
+                        found.extend(cells[(x, y, z)])
+        found.sort(key=self.order.get)
+        return found
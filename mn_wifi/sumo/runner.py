@@ -105,8 +105,7 @@ def start( self, cars, config_file, clients, port ):
                         y2 = vehicleCmds.getPosition(vehID2)[1]
 
                         if int(vehID1) < len(cars):
-                            cars[int(vehID1)].params['position'] = x1, y1, 0
-                            cars[int(vehID1)].set_pos_wmediumd(cars[int(vehID1)].params['position'])
+                            mobility.set_pos(cars[int(vehID1)], (x1, y1, 0))
 
                         if abs(x1-x2)>0 and abs(x1-x2)<20 \
                                 and (road1 == opposite_road2 or road2 == opposite_road1):
@@ -9,6 +9,8 @@
    * single=True - opens a single window and put all nodes together
    * data_type - refer to statistics dir at /sys/class/ieee80211/{}/device/net/{}/statistics/{}
             - other data_types: rssi - gets the rssi value
+                                per - PER (%) of the link at its rssi
+                                goodput - expected goodput (Mbps) of the link
 """
 
 import os
@@ -23,7 +25,9 @@
 from os import path
 from threading import Thread as thread
 from datetime import date
+from mn_wifi.devices import rateTable
 from mn_wifi.node import AP
+from mn_wifi.propagationModels import propagationModel as ppm
 
 
 today = date.today()
@@ -150,6 +154,19 @@ def get_rssi(node, iface, time, filename):
     os.system("echo '%s,%s' >> %s" % (time, rssi, filename.format(node)))
 
 
+def get_link_quality(node, wlan, time, filename, data_type):
+    """PER or goodput of the best MCS at the rssi of the node, from the PER
+    tables wmediumd uses"""
+    value = 0
+    rssi = node.params['rssi'][wlan] if 'rssi' in node.params else 0
+    if not isinstance(node, AP) and rssi:
+        mcs = rateTable.get(node, wlan, rssi - ppm.noise_threshold)
+        if mcs:
+            value = 100 * mcs[1] if data_type == 'per' \
+                else mcs[0] * (1 - mcs[1])
+    os.system("echo '%s,%s' >> %s" % (time, value, filename.format(node)))
+
+
 def get_values_from_statistics(tx_bytes, time, node, filename):
     tx = telemetry.calc(float(tx_bytes[0]), node)
     os.system("echo '%s,%s' >> %s" % (time, tx, filename.format(node)))
@@ -173,6 +190,7 @@ class parseData(object):
     filename = None
     thread_ = None
     dir = 'cat /sys/class/ieee80211/{}/device/net/{}/statistics/{}'
+    data_types = ['rssi', 'position', 'per', 'goodput']  # not in statistics
 
     def __init__(self, nodes, fig, axes, single, data_type):
         self.start(nodes, fig, axes, single, data_type)
@@ -205,7 +223,7 @@ def animate(self, i):
                 nodes_y[node] = []
                 arr = self.nodes.index(node)
 
-                if self.data_type != 'rssi' and self.data_type != 'position':
+                if self.data_type not in self.data_types:
                     if isinstance(node, AP):
                         tx_bytes = subprocess.check_output(
                             ("%s" % self.dir).format(self.phys[arr],
@@ -224,6 +242,9 @@ def animate(self, i):
                     get_rssi(node, self.ifaces[node][wlan], now, self.filename)
                 elif self.data_type == 'position':
                     get_position(node, self.filename)
+                elif self.data_type in ['per', 'goodput']:
+                    get_link_quality(node, wlan, now, self.filename,
+                                     self.data_type)
                 else:
                     get_values_from_statistics(tx_bytes, now, node, self.filename)
 
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test that the association engine gives the links of the per pair path
+   of mobility.configureLinks."""
+
+import unittest
+
+from mn_wifi.associationEngine import associationEngine
+from mn_wifi.mobility import mobility
+from mn_wifi.node import Station, AP
+from mn_wifi.propagationModels import propagationModel as ppm
+from mn_wifi.wmediumdConnector import w_cst, wmediumd_mode
+
+
+def new_node(cls, name, idx, pos, **params):
+    "Node with the params used by configureLinks, without a shell"
+    node = cls.__new__(cls)
+    node.name = name
+    node.func = ['managed'] if cls is Station else ['ap']
+    node.params = dict(wlan=['%s-wlan0' % name],
+                       mac=['02:00:00:00:%02x:00' % idx],
+                       associatedTo=[''], apsInRange={}, rssi=[0],
+                       freq=[2.412], channel=[1], mode=['g'],
+                       antennaGain=[5], antennaHeight=[1], txpower=[14],
+                       range=[50], position=pos)
+    node.params.update(params)
+    node.cmds = []
+    node.pexec = node.cmds.append
+    return node
+
+
+class testAssociationEngine(unittest.TestCase):
+    "Same associations, RSSI and commands with and without the engine"
+
+    # moves of the stations, one list of positions per tick
+    ticks = [[(10, 0, 0), (55, 5, 0), (90, 0, 0), (150, 40, 0)],
+             [(20, 0, 0), (65, 5, 0), (90, 0, 0), (130, 10, 0)],
+             [(70, 0, 0), (65, 5, 0), (40, 0, 0), (175, 0, 0)],
+             [(70, 0, 0), (118, 0, 0), (40, 0, 0), (175, 0, 0)]]
+
+    def setUp(self):
+        wmediumd_mode.mode = w_cst.ERRPROB_MODE
+        ppm.setAttr(model='logDistance', exp=3)
+        mobility.ac = None
+
+    def tearDown(self):
+        wmediumd_mode.mode = w_cst.WRONG_MODE
+        mobility.engine = None
+        mobility.aps = []
+        mobility.stations = []
+
+    def run_ticks(self, engine):
+        aps = [new_node(AP, 'ap%d' % idx, idx, (60 * idx, 0, 0),
+                        channel=[1 + 5 * idx], ssid=['ssid%d' % idx],
+                        associatedStations=[], stationsInRange={})
+               for idx in range(3)]
+        stations = [new_node(Station, 'sta%d' % idx, 16 + idx, None)
+                    for idx in range(len(self.ticks[0]))]
+        mobility.aps, mobility.stations = aps, stations
+        mobility.ap_index.build(aps)
+        mobility.engine = engine
+        states = []
+        for positions in self.ticks:
+            for sta, pos in zip(stations, positions):
+                sta.params['position'] = pos
+            mobility.configureLinks(stations)
+            states.append([(sta.params['associatedTo'][0] and
+                            sta.params['associatedTo'][0].name,
+                            sorted((ap.name, round(rssi, 6)) for ap, rssi in
+                                   sta.params['apsInRange'].items()),
+                            round(sta.params['rssi'][0], 6), sta.cmds[:])
+                           for sta in stations])
+        return states
+
+    def testSameLinks(self):
+        expected = self.run_ticks(None)
+        self.assertEqual(self.run_ticks(associationEngine()), expected)
+        self.assertEqual(expected[-1][1][0], 'ap2')
+
+    def testRssiChange(self):
+        "A txpower change alone updates the RSSI of the stations in range"
+        engine = associationEngine()
+        self.run_ticks(engine)
+        ap = mobility.aps[1]
+        sta = mobility.stations[0]
+        before = sta.params['apsInRange'][ap]
+        ap.params['txpower'][0] = 20
+        mobility.configureLinks(mobility.stations)
+        self.assertEqual(sta.params['apsInRange'][ap], before + 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test the simulation clock and the scheduler of timed events."""
+
+import unittest
+from threading import Thread
+
+from mn_wifi.scheduler import clock, scheduler
+
+
+class testClock(unittest.TestCase):
+    "Scaled, paused and stepped time"
+
+    def tearDown(self):
+        clock.reset()
+
+    def testReset(self):
+        clock.set_scale(10)
+        clock.set_stepped()
+        clock.step(5)
+        clock.pause()
+        clock.reset()
+        self.assertEqual((clock.scale, clock.paused, clock.stepped),
+                         (1.0, False, False))
+        self.assertTrue(0 <= clock.now() < 1)
+
+    def testStepped(self):
+        clock.set_stepped()
+        start = clock.now()
+        self.assertEqual(clock.now(), start)
+        clock.step(2.5)
+        self.assertEqual(clock.now(), start + 2.5)
+
+    def testPaused(self):
+        clock.pause()
+        start = clock.now()
+        self.assertEqual(clock.now(), start)
+        clock.resume()
+        self.assertFalse(clock.is_paused())
+
+    def testScale(self):
+        self.assertRaises(ValueError, clock.set_scale, 0)
+
+
+class testScheduler(unittest.TestCase):
+    "Events run in time order as the clock is stepped"
+
+    def setUp(self):
+        clock.reset()
+        clock.set_stepped()
+        self.alive = True
+        self.sched = scheduler(lambda: self.alive)
+        self.thread = None
+
+    def tearDown(self):
+        self.alive = False
+        if self.thread:
+            self.thread.join(2)
+        clock.reset()
+
+    def run_sched(self):
+        self.thread = Thread(target=self.sched.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def testOrder(self):
+        ran = []
+        for t in [3, 1, 2]:
+            self.sched.add(t, ran.append, t)
+        self.run_sched()
+        clock.step(1.5)
+        self.assertEqual(ran, [1])
+        clock.step(2)
+        self.assertEqual(ran, [1, 2, 3])
+        self.thread.join(2)
+        self.assertFalse(self.thread.is_alive())
+
+    def testReschedule(self):
+        "Events may add events, the step only returns once they ran"
+        ran = []
+
+        def event(n):
+            ran.append(clock.now())
+            if n:
+                self.sched.add(clock.now() + 0.1, event, n - 1)
+        self.sched.add(0.1, event, 9)
+        self.run_sched()
+        clock.step(1.05)
+        self.assertEqual(len(ran), 10)
+
+    def testPausedIdle(self):
+        "wait_idle returns once the threads wait on the paused clock"
+        ran = []
+        clock.set_stepped(False)
+        self.sched.add(clock.now() + 0.05, ran.append, 1)
+        self.sched.add(clock.now() + 60, ran.append, 2)
+        self.run_sched()
+        while not ran:
+            clock.sleep(0.01)
+        clock.pause()
+        clock.wait_idle()
+        self.assertEqual(ran, [1])
+        self.assertTrue(self.thread.is_alive())
+
+    def testRoundingError(self):
+        """Event times which are not exact in binary (the difference with
+        the start, computed again, is a bit below the offset)"""
+        start = 0.3144
+        clock.step(start)
+        ran = []
+        for offset in [0.7, 1.1, 1.3]:
+            self.sched.add(start + offset, ran.append, offset)
+        self.run_sched()
+        clock.step(1.3)
+        self.assertEqual(ran, [0.7, 1.1, 1.3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test the wmediumd connector against the stand-in wmediumd server."""
+
+import unittest
+
+from mininet.log import setLogLevel
+from mn_wifi.node import Station, AP
+from mn_wifi.wmediumdConnector import w_server, w_medium, w_cst, w_pos, \
+    w_txpower, w_gain, w_height, WmediumdGRandom, SNRLink, \
+    WmediumdIntfRef, WmediumdException
+from mn_wifi.wmediumdStub import w_stub
+
+
+def intf(idx):
+    return WmediumdIntfRef('sta%d' % idx, 'sta%d-wlan0' % idx,
+                           '02:00:00:00:%02x:00' % idx)
+
+
+class testWmediumdConnector(unittest.TestCase):
+    "Requests and responses of w_server"
+
+    def setUp(self):
+        self.stub = w_stub().start()
+        w_server.connect(self.stub.path)
+
+    def tearDown(self):
+        w_server.disconnect()
+        self.stub.stop()
+
+    def testPos(self):
+        "A position update reaches the server"
+        w_server.update_pos(w_pos(intf(1), [10, 20, 0]), None)
+        self.assertEqual(self.stub.get(w_cst.WSERVER_POS_UPDATE_REQUEST_TYPE),
+                         [('02:00:00:00:01:00', 10.0, 20.0, 0.0)])
+
+    def testBatch(self):
+        "Batched updates of every kind arrive in order"
+        updates = []
+        for idx in range(50):
+            updates += [w_pos(intf(idx), [idx, 0, 0]),
+                        w_txpower(intf(idx), 14), w_gain(intf(idx), 5),
+                        w_height(intf(idx), 1),
+                        WmediumdGRandom(intf(idx), 0.5)]
+        w_server.update_batch(updates)
+        self.assertEqual(len(self.stub.received), len(updates))
+        self.assertEqual([values[0] for _, values in self.stub.received],
+                         [update.staintf.get_mac() for update in updates])
+        self.assertEqual(
+            self.stub.get(w_cst.WSERVER_TXPOWER_UPDATE_REQUEST_TYPE)[-1],
+            ('02:00:00:00:31:00', 14))
+
+    def testLatency(self):
+        "Responses are matched with their requests when they are late"
+        self.stub.latency = 0.001
+        w_server.update_pos_batch([w_pos(intf(idx), [idx, 0, 0])
+                                   for idx in range(20)])
+        w_server.update_link_snr(SNRLink(intf(1), intf(2), 25))
+        self.assertEqual(
+            self.stub.get(w_cst.WSERVER_SNR_UPDATE_REQUEST_TYPE),
+            [('02:00:00:00:01:00', '02:00:00:00:02:00', 25)])
+
+    def testError(self):
+        "Error codes of the server raise WmediumdException"
+        self.stub.codes[w_cst.WSERVER_GAIN_UPDATE_REQUEST_TYPE] = \
+            w_cst.WUPDATE_INTF_NOTFOUND
+        self.assertRaises(WmediumdException, w_server.update_gain,
+                          w_gain(intf(1), 5))
+        w_server.update_height(w_height(intf(1), 2))
+
+    def testRegister(self):
+        "Interfaces get the index of the server"
+        self.assertEqual(w_server.register_interface('02:00:00:00:01:00'), 0)
+        self.assertEqual(w_server.register_interface('02:00:00:00:02:00'), 1)
+        w_server.unregister_interface('02:00:00:00:01:00')
+        self.assertEqual(self.stub.stations, ['02:00:00:00:02:00'])
+
+
+class testWmediumdMedia(unittest.TestCase):
+    "Updates go to the wmediumd of the medium of the interface"
+
+    def setUp(self):
+        self.stubs = [w_stub().start(), w_stub().start()]
+        self.media = [w_medium('ch1', first=True), w_medium('ch6')]
+        for medium, stub in zip(self.media, self.stubs):
+            medium.server.connect(stub.path)
+        w_server.servers = dict((intf(idx).get_mac(),
+                                 self.media[idx % 2].server)
+                                for idx in range(10))
+
+    def tearDown(self):
+        w_server.servers = {}
+        for medium, stub in zip(self.media, self.stubs):
+            medium.server.disconnect()
+            stub.stop()
+
+    def testRouting(self):
+        w_server.update_batch([w_pos(intf(idx), [idx, 0, 0])
+                               for idx in range(10)])
+        w_server.update_txpower(w_txpower(intf(3), 10))
+        for idx, stub in enumerate(self.stubs):
+            self.assertEqual(
+                [values[1] for values in
+                 stub.get(w_cst.WSERVER_POS_UPDATE_REQUEST_TYPE)],
+                [float(pos) for pos in range(idx, 10, 2)])
+        self.assertEqual(
+            len(self.stubs[1].get(w_cst.WSERVER_TXPOWER_UPDATE_REQUEST_TYPE)),
+            1)
+
+    def testSplit(self):
+        "Clients join the medium of the closest AP, whatever their channel"
+        def node(cls, name, pos, channel, func):
+            node_ = cls.__new__(cls)
+            node_.name, node_.func = name, [func]
+            node_.params = dict(mac=['02:00:00:00:00:00'],
+                                wlan=['%s-wlan0' % name], position=pos,
+                                channel=[channel], freq=[2.412])
+            return node_
+        aps = [node(AP, 'ap1', (0, 0, 0), 1, 'ap'),
+               node(AP, 'ap2', (100, 0, 0), 6, 'ap')]
+        nodes = aps + [node(Station, 'sta1', (90, 0, 0), 1, 'managed'),
+                       node(Station, 'sta2', (200, 0, 0), 1, 'mesh')]
+        self.assertEqual(w_medium.split(nodes, aps),
+                         {'ap1.ap1-wlan0': 'ch1', 'ap2.ap2-wlan0': 'ch6',
+                          'sta1.sta1-wlan0': 'ch6',
+                          'sta2.sta2-wlan0': 'ch1'})
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
@@ -9,10 +9,12 @@
 import tempfile
 import subprocess
 import signal
-from time import sleep
+from time import sleep, time
 import struct
 import pkg_resources
 from sys import version_info as py_version_info
+from threading import Thread, Lock, Event, local
+from collections import deque
 
 from mininet.log import info, error, debug
 
@@ -98,66 +100,48 @@ class WmediumdException(Exception):
 
 class set_interference(object):
 
-    def __init__(self, configstr, ppm, pos, txpowers,
+    def __init__(self, config, ppm, pos, txpowers,
                  fading_coefficient, noise_threshold, isnodeaps):
 
-        self.interference(configstr, ppm, pos, txpowers,
+        self.interference(config, ppm, pos, txpowers,
                           fading_coefficient, noise_threshold, isnodeaps)
 
-    def interference(self, configstr, ppm, pos, txpowers,
+    def interference(self, config, ppm, pos, txpowers,
                      fading_coefficient, noise_threshold, isnodeaps):
-        configstr += '\n\t];\n\tenable_interference = true;'
-        configstr += '\n};\nmodel:\n{\n'
-        configstr += '\ttype = "path_loss";\n\tpositions = ('
-        first_pos = True
-        for mappedpos in pos:
-            posX = float(mappedpos.sta_pos[0])
-            posY = float(mappedpos.sta_pos[1])
-            posZ = float(mappedpos.sta_pos[2])
-            if first_pos:
-                first_pos = False
-            else:
-                configstr += ','
-            configstr += '\n\t\t(%.1f, %.1f, %.1f)' % (
-                posX, posY, posZ)
-        configstr += '\n\t);\n\tfading_coefficient = %d;' % fading_coefficient
-        configstr += '\n\tnoise_threshold = %d;' % noise_threshold
-        configstr += '\n\tisnodeaps = ('
-        first_isnodeap = True
-        for isnodeap in isnodeaps:
-            if first_isnodeap:
-                configstr += '%s' % isnodeap
-                first_isnodeap = False
-            else:
-                configstr += ', %s' % isnodeap
-        configstr += ');\n\ttx_powers = ('
-        first_txpower = True
-        for mappedtxpower in txpowers:
-            txpower = mappedtxpower.sta_txpower
-            if first_txpower:
-                configstr += '%s' % txpower
-                first_txpower = False
-            else:
-                configstr += ', %s' % txpower
+        "Writes the path loss model to the config file"
+        from mn_wifi.floorPlan import floorPlan
+        if len(floorPlan.walls):
+            info('*** The path loss model of wmediumd has no per link loss: '
+                 'walls only apply to the RSSI computed by Mininet-WiFi\n')
+        config.write('\n\t];\n\tenable_interference = true;'
+                     '\n};\nmodel:\n{\n\ttype = "path_loss";\n\tpositions = (')
+        config.write(','.join('\n\t\t(%.1f, %.1f, %.1f)' % (
+            float(mappedpos.sta_pos[0]), float(mappedpos.sta_pos[1]),
+            float(mappedpos.sta_pos[2])) for mappedpos in pos))
+        config.write('\n\t);\n\tfading_coefficient = %d;' % fading_coefficient)
+        config.write('\n\tnoise_threshold = %d;' % noise_threshold)
+        config.write('\n\tisnodeaps = (%s' % ', '.join(
+            '%s' % isnodeap for isnodeap in isnodeaps))
+        config.write(');\n\ttx_powers = (%s' % ', '.join(
+            '%s' % mappedtxpower.sta_txpower for mappedtxpower in txpowers))
         if ppm.model == 'ITU':
-            configstr += ');\n\tmodel_name = "itu";\n\tnFLOORS = %d;' \
-                         '\n\tlF = %d;\n\tpL = %d;\n};' % \
-                         (ppm.nFloors, ppm.lF, ppm.pL)
+            config.write(');\n\tmodel_name = "itu";\n\tnFLOORS = %d;'
+                         '\n\tlF = %d;\n\tpL = %d;\n};' %
+                         (ppm.nFloors, ppm.lF, ppm.pL))
         elif ppm.model == 'logDistance':
-            configstr += ');\n\tmodel_name = "log_distance";' \
-                         '\n\tpath_loss_exp = %.1f;\n\txg = 0.0;\n};' \
-                         % ppm.exp
+            config.write(');\n\tmodel_name = "log_distance";'
+                         '\n\tpath_loss_exp = %.1f;\n\txg = 0.0;\n};'
+                         % ppm.exp)
         elif ppm.model == 'twoRayGround':
-            configstr += ');\n\tmodel_name = "two_ray_ground";' \
-                         '\n\tsL = %d;\n};' % ppm.sL
+            config.write(');\n\tmodel_name = "two_ray_ground";'
+                         '\n\tsL = %d;\n};' % ppm.sL)
         elif ppm.model == 'logNormalShadowing':
-            configstr += ');\n\tmodel_name = "log_normal_shadowing";' \
-                         '\n\tpath_loss_exp = %.1f;\n\tsL = %d;\n};' \
-                         % (ppm.exp, ppm.sL)
+            config.write(');\n\tmodel_name = "log_normal_shadowing";'
+                         '\n\tpath_loss_exp = %.1f;\n\tsL = %d;\n};'
+                         % (ppm.exp, ppm.sL))
         else:
-            configstr += ');\n\tmodel_name = "free_space";\n\tsL = %d;\n};' \
-                         % ppm.sL
-        w_starter.configstr = configstr
+            config.write(');\n\tmodel_name = "free_space";\n\tsL = %d;\n};'
+                         % ppm.sL)
 
 
 class w_starter(object):
@@ -167,9 +151,13 @@ class w_starter(object):
     wmd_process = None
     wmd_logfile = None
     wmd_config_name = None
-    configstr = ''
     default_auto_errprob = 0.0
     default_auto_snr = -10
+    wmediumd_snr = 30  # SNR wmediumd gives to the links its config lacks
+    stop_timeout = 2.0  # seconds wmediumd is given to exit on a signal
+    parameters = []  # more wmediumd arguments (see w_medium)
+    server = None  # w_server of the medium, w_server by default
+    data = {}  # arguments of the last start (see restart)
 
     @classmethod
     def start(cls, intfrefs=None, links=None, default_auto_snr=-10,
@@ -195,7 +183,7 @@ def start(cls, intfrefs=None, links=None, default_auto_snr=-10,
             intfrefs = []
         if links is None:
             links = []
-        parameters = ['-l', '4', '-s']
+        parameters = ['-l', '4', '-s'] + cls.parameters
 
         kwargs['intfrefs'] = intfrefs
         kwargs['links'] = links
@@ -209,6 +197,7 @@ def start(cls, intfrefs=None, links=None, default_auto_snr=-10,
         kwargs['noise_threshold'] = noise_threshold
         kwargs['ppm'] = ppm
         kwargs['maclist'] = maclist
+        cls.data = kwargs
 
         if wmediumd_mode.mode == 4:
             raise Exception("Wrong wmediumd mode given")
@@ -218,7 +207,7 @@ def start(cls, intfrefs=None, links=None, default_auto_snr=-10,
         if wm == 0:
             cls.is_initialized = True
             cls.initialize(**kwargs)
-            w_server.connect()
+            cls.server.connect()
         else:
             info('*** Wmediumd is being used, but it is not installed.\n' \
                   '*** Please install Wmediumd with sudo util/install.sh -l.\n')
@@ -242,101 +231,37 @@ def initialize(cls, **kwargs):
         if cls.is_connected:
             raise WmediumdException("w_starter is already connected")
 
-        mappedintf = {}
         mappedlinks = {}
         if wmediumd_mode.mode != w_cst.INTERFERENCE_MODE:
             # Map all links using the interface id and check for missing
             # interfaces in the  intfrefs list
+            stations = set(intfref.get_station_name()
+                           for intfref in kwargs['intfrefs'])
             for link in kwargs['links']:
-                link_id = link.sta1intf.id() + '/' + link.sta2intf.id()
-                mappedlinks[link_id] = link
-                found1 = False
-                found2 = False
-                for intfref in kwargs['intfrefs']:
-                    if link.sta1intf.get_station_name() == \
-                            intfref.get_station_name():
-                        if link.sta1intf.get_station_name() == \
-                                intfref.get_station_name():
-                            found1 = True
-                    if link.sta2intf.get_station_name() == \
-                            intfref.get_station_name():
-                        if link.sta2intf.get_station_name() == \
-                                intfref.get_station_name():
-                            found2 = True
-                if not found1:
-                    raise WmediumdException('%s is not part of the managed '
-                                            'interfaces'
-                                            % link.sta1intf.id())
-                    pass
-                if not found2:
-                    raise WmediumdException('%s is not part of the managed '
-                                            'interfaces'
-                                            % link.sta2intf.id())
+                for intf in [link.sta1intf, link.sta2intf]:
+                    if intf.get_station_name() not in stations:
+                        raise WmediumdException('%s is not part of the '
+                                                'managed interfaces'
+                                                % intf.id())
+                mappedlinks[(link.sta1intf.id(), link.sta2intf.id())] = link
 
         if wmediumd_mode.mode is not w_cst.SPECPROB_MODE:
-            if wmediumd_mode.mode is not w_cst.INTERFERENCE_MODE:
-                for intfref1 in kwargs['intfrefs']:
-                    for intfref2 in kwargs['intfrefs']:
-                        if intfref1 is not intfref2:
-                            link_id = intfref1.id() + '/' + \
-                                      intfref2.id()
-                            if wmediumd_mode.mode == \
-                                    w_cst.ERRPROB_MODE:
-                                mappedlinks.setdefault(
-                                    link_id, ERRPROBLink(
-                                        intfref1, intfref2,
-                                        cls.default_auto_errprob))
-                            else:
-                                mappedlinks.setdefault(
-                                    link_id, SNRLink(
-                                        intfref1, intfref2,
-                                        cls.default_auto_snr))
-
-            # Create wmediumd config
+            # Create wmediumd config, written as it is generated
             wmd_config = tempfile.NamedTemporaryFile(
-                prefix='mn_wmd_config_', suffix='.cfg', delete=False)
+                mode='w', prefix='mn_wmd_config_', suffix='.cfg',
+                delete=False)
             cls.wmd_config_name = wmd_config.name
             debug("Name of wmediumd config: %s\n" % cls.wmd_config_name)
-            configstr = 'ifaces:\n{\n\tids = [\n'
-            intfref_id = 0
-            for intfref in kwargs['intfrefs']:
-                if intfref_id != 0:
-                    configstr += ', \n'
-                grepped_mac = intfref.get_mac()
-                configstr += '\t\t"%s"' % grepped_mac
-                mappedintf[intfref.id()] = intfref_id
-                intfref_id += 1
+            wmd_config.write('ifaces:\n{\n\tids = [\n')
+            wmd_config.write(', \n'.join('\t\t"%s"' % intfref.get_mac()
+                                         for intfref in kwargs['intfrefs']))
 
             if wmediumd_mode.mode is w_cst.INTERFERENCE_MODE:
-                set_interference(configstr, kwargs['ppm'], kwargs['pos'],
+                set_interference(wmd_config, kwargs['ppm'], kwargs['pos'],
                                  kwargs['txpowers'], kwargs['fading_coefficient'],
                                  kwargs['noise_threshold'], kwargs['isnodeaps'])
-                configstr = cls.configstr
             else:
-                configstr += '\n\t];\n};\nmodel:\n{\n\ttype = "'
-                if wmediumd_mode.mode == w_cst.ERRPROB_MODE:
-                    configstr += 'prob'
-                else:
-                    configstr += 'snr'
-                configstr += '";\n\tdefault_prob = 1.0;\n\tlinks = ('
-                first_link = True
-                for mappedlink in mappedlinks.values():
-                    id1 = mappedlink.sta1intf.id()
-                    id2 = mappedlink.sta2intf.id()
-                    if first_link:
-                        first_link = False
-                    else:
-                        configstr += ','
-                    if wmediumd_mode.mode == w_cst.ERRPROB_MODE:
-                        configstr += '\n\t\t(%d, %d, %f)' % (
-                            mappedintf[id1], mappedintf[id2],
-                            mappedlink.errprob)
-                    else:
-                        configstr += '\n\t\t(%d, %d, %d)' % (
-                            mappedintf[id1], mappedintf[id2],
-                            mappedlink.snr)
-                configstr += '\n\t);\n};'
-            wmd_config.write(configstr.encode())
+                cls.write_links(wmd_config, kwargs['intfrefs'], mappedlinks)
             wmd_config.close()
         # Start wmediumd using the created config
         cmdline = ['wmediumd']
@@ -366,6 +291,71 @@ def initialize(cls, **kwargs):
                                            preexec_fn=os.setpgrp)
         cls.is_connected = True
 
+    @classmethod
+    def get_default_rows(cls, count, links):
+        """Links of each interface to the ones it has no explicit link to,
+        as config lines, when the default SNR is not the one of wmediumd"""
+        if wmediumd_mode.mode == w_cst.ERRPROB_MODE or \
+                cls.default_auto_snr == cls.wmediumd_snr:
+            return
+        explicit = {}
+        for id1, id2 in links:
+            explicit.setdefault(id1, set()).add(id2)
+        tails = ['%d, %d)' % (id2, cls.default_auto_snr)
+                 for id2 in range(count)]
+        for id1 in range(count):
+            head = '\n\t\t(%d, ' % id1
+            skip = explicit.get(id1, ())
+            yield [head + tail for id2, tail in enumerate(tails)
+                   if id2 != id1 and id2 not in skip]
+
+    @classmethod
+    def write_links(cls, config, intfrefs, mappedlinks):
+        """Writes the snr/prob model to the config file. The links which
+        are not given get the default error probability/SNR of wmediumd
+        (default_prob), so only the given ones are written, unless the
+        default SNR is not the one of wmediumd"""
+        errprob = wmediumd_mode.mode == w_cst.ERRPROB_MODE
+        mappedintf = dict((intfref.id(), idx)
+                          for idx, intfref in enumerate(intfrefs))
+        links = {}
+        for (id1, id2), link in mappedlinks.items():
+            links[(mappedintf[id1], mappedintf[id2])] = \
+                link.errprob if errprob else link.snr
+
+        config.write('\n\t];\n};\nmodel:\n{\n\ttype = "%s";'
+                     % ('prob' if errprob else 'snr'))
+        if errprob:
+            config.write('\n\tdefault_prob = %f;' % cls.default_auto_errprob)
+        config.write('\n\tlinks = (')
+        line = '\n\t\t(%d, %d, %f)' if errprob else '\n\t\t(%d, %d, %d)'
+        lines = [line % (id1, id2, value)
+                 for (id1, id2), value in links.items()]
+        config.write(','.join(lines))
+        sep = ',' if lines else ''
+        for row in cls.get_default_rows(len(intfrefs), links):
+            if row:
+                config.write(sep + ','.join(row))
+                sep = ','
+        config.write('\n\t);\n};')
+
+    @classmethod
+    def restart(cls, **kwargs):
+        """Starts wmediumd again with the data of the last start, updated
+        with kwargs (e.g. pos, txpowers, ppm or noise_threshold). The
+        path loss model is only read from the config, so a new one needs
+        a new wmediumd; the interfaces and the rest of the experiment
+        are kept"""
+        from mn_wifi.shadowing import shadowing
+        if cls.server.connected:
+            cls.server.disconnect()
+        if cls.is_connected:
+            cls.stop()
+        cls.data = dict(cls.data, **kwargs)
+        cls.initialize(**cls.data)
+        cls.server.connect()
+        shadowing.clear_sent()
+
     @classmethod
     def start_managed(cls):
         """Start the connector in managed mode, which means disconnect and
@@ -397,6 +387,37 @@ def stop(cls):
             raise WmediumdException('w_starter is not connected '
                                     'to wmediumd')
 
+    @classmethod
+    def get_log_tail(cls, lines=10):
+        "Last lines of the log of wmediumd"
+        try:
+            with open(cls.wmd_logfile.name) as log:
+                return ''.join(log.readlines()[-lines:])
+        except (AttributeError, IOError, OSError):
+            return ''
+
+    @classmethod
+    def check_running(cls):
+        "Raises WmediumdException if the wmediumd we started has exited"
+        if cls.is_connected and cls.wmd_process is not None \
+                and cls.wmd_process.poll() is not None:
+            raise WmediumdException('wmediumd exited with code %s:\n%s'
+                                    % (cls.wmd_process.returncode,
+                                       cls.get_log_tail()))
+
+    @classmethod
+    def wait_exit(cls, timeout):
+        "Waits up to timeout seconds for wmediumd to exit. True if it did"
+        deadline = time() + timeout
+        delay = 0.01
+        while cls.wmd_process.poll() is None:
+            left = deadline - time()
+            if left <= 0:
+                return False
+            sleep(min(delay, left))
+            delay = min(delay * 2, 0.2)
+        return True
+
     @classmethod
     def kill_wmediumd(cls):
         if cls.is_managed:
@@ -407,13 +428,46 @@ def kill_wmediumd(cls):
         try:
             # SIGINT to allow closing resources
             cls.wmd_process.send_signal(signal.SIGINT)
-            sleep(0.5)
-            # SIGKILL in case it did not finish
-            cls.wmd_process.send_signal(signal.SIGKILL)
+            if not cls.wait_exit(cls.stop_timeout):
+                # SIGKILL in case it did not finish
+                cls.wmd_process.send_signal(signal.SIGKILL)
+                cls.wait_exit(cls.stop_timeout)
         except OSError:
             pass
 
 
+class w_future(object):
+    "Response to a request sent to wmediumd, available once it arrives"
+
+    def __init__(self, key=None, index=-1):
+        self.key = key  # first mac of the request, if any
+        self.index = index  # field of the response returned by result()
+        self.event = Event()
+        self.resp = None
+        self.exc = None
+
+    def set_result(self, resp):
+        self.resp = resp
+        self.event.set()
+
+    def set_exception(self, exc):
+        self.exc = exc
+        self.event.set()
+
+    def done(self):
+        return self.event.is_set()
+
+    def result(self, timeout=None):
+        "Waits for the response (by default the WUPDATE_* constant)"
+        if not self.event.wait(timeout):
+            raise WmediumdException("Timed out waiting for wmediumd")
+        if self.exc:
+            raise self.exc
+        if self.index is None:
+            return self.resp
+        return self.resp[self.index]
+
+
 class w_pos(object):
     def __init__(self, staintf, sta_pos):
         """
@@ -537,6 +591,14 @@ def __init__(self, sta1intf, sta2intf, errprobs):
         self.errprobs = errprobs
 
 
+def mac_to_bytes(mac):
+    "Packs a MAC address string into 6 bytes"
+    # type: (str) -> bytes
+    if py_version_info < (3, 0):
+        return mac.replace(':', '').decode('hex')
+    return bytes.fromhex(mac.replace(':', ''))
+
+
 class WmediumdIntfRef:
     'Intf Ref'
     def __init__(self, staname, intfname, intfmac):
@@ -554,6 +616,8 @@ def __init__(self, staname, intfname, intfmac):
         self.__staname = staname
         self.__intfname = intfname
         self.__intfmac = intfmac
+        self.__packed_mac = None
+        self.__packed_for = None  # MAC address __packed_mac was built from
 
     def get_station_name(self):
         """
@@ -576,6 +640,18 @@ def get_mac(self):
         """
         return self.__intfmac
 
+    def get_mac_bytes(self):
+        """
+        Get the MAC address of the interface packed in 6 bytes. It is
+        packed again only when the MAC address changes
+        :rtype: bytes
+        """
+        mac = self.get_mac()
+        if mac != self.__packed_for:
+            self.__packed_mac = mac_to_bytes(mac)
+            self.__packed_for = mac
+        return self.__packed_mac
+
     def id(self):
         """
         Id used in dicts
@@ -600,6 +676,7 @@ def __init__(self, sta, intf=None):
         WmediumdIntfRef.__init__(self, "", "", "")
         self.__sta = sta
         self.__intf = intf
+        self.__index = None  # position of the interface in params['wlan']
 
     def get_station_name(self):
         return self.__sta.name
@@ -614,15 +691,13 @@ def get_intf_name(self):
 
     def get_mac(self):
         intf_name = self.get_intf_name()
-        index = 0
-        found = False
-        for wlan_intf in self.__sta.params['wlan']:
-            if wlan_intf == intf_name:
-                found = True
-                break
-            index += 1
-        if found:
-            return self.__sta.params['mac'][index]
+        wlans = self.__sta.params['wlan']
+        index = self.__index
+        if index is None or index >= len(wlans) or wlans[index] != intf_name:
+            if intf_name not in wlans:
+                return None
+            index = self.__index = wlans.index(intf_name)
+        return self.__sta.params['mac'][index]
 
 
 class w_server(object):
@@ -729,23 +804,87 @@ class w_server(object):
     __station_add_response_struct = \
         struct.Struct('!' + __station_add_response_fmt)
 
+    __response_structs = {
+        w_cst.WSERVER_SNR_UPDATE_RESPONSE_TYPE: __snr_update_response_struct,
+        w_cst.WSERVER_POS_UPDATE_RESPONSE_TYPE: __pos_update_response_struct,
+        w_cst.WSERVER_TXPOWER_UPDATE_RESPONSE_TYPE:
+            __txpower_update_response_struct,
+        w_cst.WSERVER_GAIN_UPDATE_RESPONSE_TYPE: __gain_update_response_struct,
+        w_cst.WSERVER_GAUSSIAN_RANDOM_UPDATE_RESPONSE_TYPE:
+            __gaussian_random_update_response_struct,
+        w_cst.WSERVER_HEIGHT_UPDATE_RESPONSE_TYPE:
+            __height_update_response_struct,
+        w_cst.WSERVER_ERRPROB_UPDATE_RESPONSE_TYPE:
+            __errprob_update_response_struct,
+        w_cst.WSERVER_SPECPROB_UPDATE_RESPONSE_TYPE:
+            __specprob_update_response_struct,
+        w_cst.WSERVER_DEL_BY_MAC_RESPONSE_TYPE:
+            __station_del_by_mac_response_struct,
+        w_cst.WSERVER_DEL_BY_ID_RESPONSE_TYPE:
+            __station_del_by_id_response_struct,
+        w_cst.WSERVER_ADD_RESPONSE_TYPE: __station_add_response_struct,
+    }
+
+    __buffers = local()  # request buffers of each thread
+
     sock = None
     connected = False
+    reader = None  # thread reading the responses
+    send_lock = Lock()  # keeps requests and pending in the same order
+    pending_lock = Lock()
+    pending = {}  # response type -> deque of w_future, in request order
+    connect_timeout = 10.0  # seconds to wait for the server to listen
+    socket_path = w_cst.SOCKET_PATH
+    starter = w_starter  # w_starter of the medium
+    servers = {}  # mac -> w_server of its medium, if there are many media
+    # update class -> method sending it (see update_batch)
+    senders = {'w_pos': 'send_pos_update',
+               'w_txpower': 'send_txpower_update',
+               'w_gain': 'send_gain_update',
+               'w_height': 'send_height_update',
+               'WmediumdGRandom': 'send_gaussian_random_update'}
 
     @classmethod
-    def connect(cls, uds_address=w_cst.SOCKET_PATH):
-        # type: (str) -> None
+    def connect(cls, uds_address=None, timeout=None):
+        # type: (str, float) -> None
         """
-        Connect to the wmediumd server
-        :param uds_address: The UNIX domain socket
+        Connect to the wmediumd server. The socket is polled with an
+        exponential backoff until the server listens, it exits or timeout
+        seconds have passed
+        :param uds_address: The UNIX domain socket (socket_path by default)
+        :param timeout: seconds to wait (connect_timeout by default)
         """
         if cls.connected:
             raise WmediumdException("Already connected to wmediumd server")
-        cls.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        uds_address = uds_address or cls.socket_path
         info('*** Connecting to wmediumd server %s\n' % uds_address)
-        sleep(1)
-        cls.sock.connect(uds_address)
+        if timeout is None:
+            timeout = cls.connect_timeout
+        deadline = time() + timeout
+        delay = 0.01
+        while True:
+            cls.starter.check_running()
+            cls.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                cls.sock.connect(uds_address)
+                break
+            except socket.error as err:
+                cls.sock.close()
+                left = deadline - time()
+                if left <= 0:
+                    raise WmediumdException(
+                        'wmediumd server %s is not listening after %.1f s '
+                        '(%s)\n%s' % (uds_address, timeout, err,
+                                      cls.starter.get_log_tail()))
+            sleep(min(delay, left))
+            delay = min(delay * 2, 0.5)
+        debug('Connected to wmediumd in %.2f s\n'
+              % (timeout - deadline + time()))
         cls.connected = True
+        cls.reader = Thread(name='wmediumdReader',
+                            target=cls.__read_responses, args=(cls.sock,))
+        cls.reader.daemon = True
+        cls.reader.start()
 
     @classmethod
     def disconnect(cls):
@@ -755,8 +894,24 @@ def disconnect(cls):
         """
         if not cls.connected:
             raise WmediumdException("Not yet connected to wmediumd server")
-        cls.sock.close()
         cls.connected = False
+        try:
+            cls.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        cls.sock.close()
+        if cls.reader:
+            cls.reader.join(1)
+            cls.reader = None
+
+    @classmethod
+    def get_server(cls, intf):
+        """w_server of the medium of the interface intf (a WmediumdIntfRef
+        or a mac), cls when there is a single medium"""
+        if not cls.servers:
+            return cls
+        mac = intf if isinstance(intf, str) else intf.get_mac()
+        return cls.servers.get(mac, cls)
 
     @classmethod
     def register_interface(cls, mac):
@@ -771,7 +926,7 @@ def register_interface(cls, mac):
         """
         info("\n%s Registering interface with mac %s"
              % (w_cst.LOG_PREFIX, mac))
-        ret, sta_id = w_server.send_add(mac)
+        ret, sta_id = cls.get_server(mac).send_add(mac)
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
@@ -788,7 +943,7 @@ def unregister_interface(cls, mac):
         """
         info("\n%s Unregistering interface with mac %s"
              % (w_cst.LOG_PREFIX, mac))
-        ret = w_server.send_del_by_mac(mac)
+        ret = cls.get_server(mac).send_del_by_mac(mac)
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
@@ -801,7 +956,7 @@ def update_link_snr(cls, link):
         :param link The link to update
         :type link: WmediumdLink
         """
-        ret = w_server.send_snr_update(link)
+        ret = cls.get_server(link.sta1intf).send_snr_update(link)
         if ret != w_cst.WUPDATE_SUCCESS:
            raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
@@ -814,11 +969,44 @@ def update_pos(cls, pos, mob):
         :param pos The pos to update
         :type pos: w_pos
         """
-        ret = w_server.send_pos_update(pos, mob)
+        ret = cls.get_server(pos.staintf).send_pos_update(pos, mob)
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
 
+    @classmethod
+    def update_pos_batch(cls, positions):
+        # type: (list) -> None
+        """
+        Update the Pos of many connections at wmediumd, sending the
+        requests (to every medium) before reading the responses
+        :param positions The list of w_pos to update
+        :type positions: list
+        """
+        cls.update_batch(positions)
+
+    @classmethod
+    def update_batch(cls, updates):
+        # type: (list) -> None
+        """
+        Update the Pos, TxPower, Antenna Gain, Antenna Height and Gaussian
+        Random of many connections at wmediumd, in any mix: every request
+        is sent (to its medium) before any response is read
+        :param updates The list of w_pos, w_txpower, w_gain, w_height and
+        WmediumdGRandom to update
+        :type updates: list
+        """
+        futures = []
+        for update in updates:
+            server = cls.get_server(update.staintf)
+            send = getattr(server, cls.senders[type(update).__name__])
+            futures.append(send(update, block=False))
+        for future in futures:
+            ret = future.result()
+            if ret != w_cst.WUPDATE_SUCCESS:
+                raise WmediumdException("Received error code from wmediumd: "
+                                        "code %d" % ret)
+
     @classmethod
     def update_txpower(cls, txpower):
         # type: (w_txpower) -> None
@@ -828,7 +1016,7 @@ def update_txpower(cls, txpower):
 
         :type txpower: w_txpower
         """
-        ret = w_server.send_txpower_update(txpower)
+        ret = cls.get_server(txpower.staintf).send_txpower_update(txpower)
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
@@ -841,7 +1029,7 @@ def update_gain(cls, gain):
         :param gain The gain to update
         :type gain: Gain
         """
-        ret = w_server.send_gain_update(gain)
+        ret = cls.get_server(gain.staintf).send_gain_update(gain)
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
@@ -854,7 +1042,8 @@ def update_gaussian_random(cls, gRandom):
         :param gRandom The gRandom to update
         :type gRandom: WmediumdGRandom
         """
-        ret = w_server.send_gaussian_random_update(gRandom)
+        ret = cls.get_server(gRandom.staintf).send_gaussian_random_update(
+            gRandom)
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
@@ -867,7 +1056,7 @@ def update_height(cls, height):
         :param height The height to update
         :type height: Height
         """
-        ret = w_server.send_height_update(height)
+        ret = cls.get_server(height.staintf).send_height_update(height)
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
@@ -880,7 +1069,7 @@ def update_link_errprob(cls, link):
         :param link The link to update
         :type link: WmediumdLink
         """
-        ret = w_server.send_errprob_update(link)
+        ret = cls.get_server(link.sta1intf).send_errprob_update(link)
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
@@ -893,34 +1082,35 @@ def update_link_specprob(cls, link):
         :param link The link to update
         :type link: WmediumdLink
         """
-        ret = w_server.send_specprob_update(link)
+        ret = cls.get_server(link.sta1intf).send_specprob_update(link)
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
 
     @classmethod
-    def send_snr_update(cls, link):
+    def send_snr_update(cls, link, block=True):
         # type: (SNRLink) -> int
         """
         Send an update to the wmediumd server
         :param link: The SNRLink to update
+        :param block: when False return a w_future instead of waiting
         :return: A WUPDATE_* constant
         """
         #debug("%s Updating SNR from interface %s to interface %s to "
         #      "value %d\n" % (w_cst.LOG_PREFIX,
         #                      link.sta1intf.get_mac(),
         #                      link.sta2intf.get_mac(), link.snr))
-        cls.sock.send(cls.__create_snr_update_request(link))
-        return cls.__parse_response(
-            w_cst.WSERVER_SNR_UPDATE_RESPONSE_TYPE,
-            cls.__snr_update_response_struct)[-1]
+        future = cls.__request(cls.__create_snr_update_request(link),
+                               w_cst.WSERVER_SNR_UPDATE_RESPONSE_TYPE)
+        return future.result() if block else future
 
     @classmethod
-    def send_pos_update(cls, pos, mob):
+    def send_pos_update(cls, pos, mob=None, block=True):
         # type: (w_pos) -> int
         """
         Send an update to the wmediumd server
         :param pos: The w_pos to update
+        :param block: when False return a w_future instead of waiting
         :return: A WUPDATE_* constant
         """
         posX = pos.sta_pos[0]
@@ -929,85 +1119,99 @@ def send_pos_update(cls, pos, mob):
         #debug("%s Updating Pos of %s to x=%s, y=%s, z=%s\n" % (
         #    w_cst.LOG_PREFIX, pos.staintf.get_mac(),
         #    posX, posY, posZ))
-        cls.sock.send(cls.__create_pos_update_request(pos, posX, posY, posZ))
-        return cls.__parse_response(
-            w_cst.WSERVER_POS_UPDATE_RESPONSE_TYPE,
-            cls.__pos_update_response_struct)[-1]
+        future = cls.__request(
+            cls.__create_pos_update_request(pos, posX, posY, posZ),
+            w_cst.WSERVER_POS_UPDATE_RESPONSE_TYPE)
+        return future.result() if block else future
+
+    @classmethod
+    def send_pos_update_batch(cls, positions):
+        # type: (list) -> list
+        """
+        Send many pos updates to the wmediumd server: every request is
+        sent before waiting for any response
+        :param positions: The list of w_pos to update
+        :return: A list of WUPDATE_* constants
+        """
+        futures = [cls.send_pos_update(pos, block=False)
+                   for pos in positions]
+        return [future.result() for future in futures]
 
     @classmethod
-    def send_txpower_update(cls, txpower):
+    def send_txpower_update(cls, txpower, block=True):
         # type: (w_txpower) -> int
         """
         Send an update to the wmediumd server
         :param txpower: The w_txpower to update
+        :param block: when False return a w_future instead of waiting
         :return: A WUPDATE_* constant
         """
         #txpower_ = txpower.sta_txpower
         #debug("%s Updating TxPower of %s to %d\n" % (
         #    w_cst.LOG_PREFIX, txpower.staintf.get_mac(),
         #    txpower_))
-        cls.sock.send(cls.__create_txpower_update_request(txpower))
-        return cls.__parse_response(
-            w_cst.WSERVER_TXPOWER_UPDATE_RESPONSE_TYPE,
-            cls.__txpower_update_response_struct)[-1]
+        future = cls.__request(cls.__create_txpower_update_request(txpower),
+                               w_cst.WSERVER_TXPOWER_UPDATE_RESPONSE_TYPE)
+        return future.result() if block else future
 
     @classmethod
-    def send_gain_update(cls, gain):
+    def send_gain_update(cls, gain, block=True):
         # type: (gain) -> int
         """
         Send an update to the wmediumd server
         :param gain: The Gain to update
+        :param block: when False return a w_future instead of waiting
         :return: A WUPDATE_* constant
         """
         #gain_ = gain.sta_gain
         #debug("%s Updating Antenna Gain of %s to %d\n" % (
         #    w_cst.LOG_PREFIX, gain.staintf.get_mac(),
         #    gain_))
-        cls.sock.send(cls.__create_gain_update_request(gain))
-        return cls.__parse_response(
-            w_cst.WSERVER_GAIN_UPDATE_RESPONSE_TYPE,
-            cls.__gain_update_response_struct)[-1]
+        future = cls.__request(cls.__create_gain_update_request(gain),
+                               w_cst.WSERVER_GAIN_UPDATE_RESPONSE_TYPE)
+        return future.result() if block else future
 
     @classmethod
-    def send_gaussian_random_update(cls, gRandom):
+    def send_gaussian_random_update(cls, gRandom, block=True):
         # type: (WmediumdGRandom) -> int
         """
         Send an update to the wmediumd server
         :param gRandom: The WmediumdGRandom to update
+        :param block: when False return a w_future instead of waiting
         :return: A WUPDATE_* constant
         """
         #gRandom_ = gRandom.sta_gaussian_random
         #debug("%s Updating Gaussian Random of %s to %s\n" % (
         #    w_cst.LOG_PREFIX, gRandom.staintf.get_mac(),
         #    gRandom_))
-        cls.sock.send(cls.__create_gaussian_random_update_request(gRandom))
-        return cls.__parse_response(
-            w_cst.WSERVER_GAUSSIAN_RANDOM_UPDATE_RESPONSE_TYPE,
-            cls.__gaussian_random_update_response_struct)[-1]
+        future = cls.__request(cls.__create_gaussian_random_update_request(gRandom),
+                               w_cst.WSERVER_GAUSSIAN_RANDOM_UPDATE_RESPONSE_TYPE)
+        return future.result() if block else future
 
     @classmethod
-    def send_height_update(cls, height):
+    def send_height_update(cls, height, block=True):
         # type: (Height) -> int
         """
         Send an update to the wmediumd server
         :param height: The Height to update
+        :param block: when False return a w_future instead of waiting
         :return: A WUPDATE_* constant
         """
         #height_ = height.sta_height
         #debug("%s Updating Antenna Height of %s to %d\n" % (
         #    w_cst.LOG_PREFIX, height.staintf.get_mac(),
         #    height_))
-        cls.sock.send(cls.__create_height_update_request(height))
-        return cls.__parse_response(
-            w_cst.WSERVER_HEIGHT_UPDATE_RESPONSE_TYPE,
-            cls.__height_update_response_struct)[-1]
+        future = cls.__request(cls.__create_height_update_request(height),
+                               w_cst.WSERVER_HEIGHT_UPDATE_RESPONSE_TYPE)
+        return future.result() if block else future
 
     @classmethod
-    def send_errprob_update(cls, link):
+    def send_errprob_update(cls, link, block=True):
         # type: (ERRPROBLink) -> int
         """
         Send an update to the wmediumd server
         :param link: The ERRPROBLink to update
+        :param block: when False return a w_future instead of waiting
         :return: A WUPDATE_* constant
         """
         #debug("\n%s Updating ERRPROB from interface %s to interface %s "
@@ -1015,52 +1219,52 @@ def send_errprob_update(cls, link):
         #          w_cst.LOG_PREFIX, link.sta1intf.get_mac(),
         #          link.sta2intf.get_mac(),
         #          link.errprob))
-        cls.sock.send(cls.__create_errprob_update_request(link))
-        return cls.__parse_response(
-            w_cst.WSERVER_ERRPROB_UPDATE_RESPONSE_TYPE,
-            cls.__errprob_update_response_struct)[-1]
+        future = cls.__request(cls.__create_errprob_update_request(link),
+                               w_cst.WSERVER_ERRPROB_UPDATE_RESPONSE_TYPE)
+        return future.result() if block else future
 
     @classmethod
-    def send_specprob_update(cls, link):
+    def send_specprob_update(cls, link, block=True):
         # type: (WmediumdSPECPROBLink) -> int
         """
         Send an update to the wmediumd server
         :param link: The WmediumdSPECPROBLink to update
+        :param block: when False return a w_future instead of waiting
         :return: A WUPDATE_* constant
         """
         #debug("\n%s Updating SPECPROB from interface %s to interface %s" % (
         #    w_cst.LOG_PREFIX, link.sta1intf.get_mac(),
         #    link.sta2intf.get_mac()))
-        cls.sock.send(cls.__create_specprob_update_request(link))
-        return cls.__parse_response(
-            w_cst.WSERVER_SPECPROB_UPDATE_RESPONSE_TYPE,
-            cls.__specprob_update_response_struct)[-1]
+        future = cls.__request(cls.__create_specprob_update_request(link),
+                               w_cst.WSERVER_SPECPROB_UPDATE_RESPONSE_TYPE)
+        return future.result() if block else future
 
     @classmethod
-    def send_del_by_mac(cls, mac):
+    def send_del_by_mac(cls, mac, block=True):
         # type: (str) -> int
         """
         Send an update to the wmediumd server
         :param mac: The mac address of the interface to be deleted
+        :param block: when False return a w_future instead of waiting
         :return: A WUPDATE_* constant
         """
-        cls.sock.send(cls.__create_station_del_by_mac_request(mac))
-        return cls.__parse_response(
-            w_cst.WSERVER_DEL_BY_MAC_RESPONSE_TYPE,
-            cls.__station_del_by_mac_response_struct)[-1]
+        future = cls.__request(cls.__create_station_del_by_mac_request(mac),
+                               w_cst.WSERVER_DEL_BY_MAC_RESPONSE_TYPE)
+        return future.result() if block else future
 
     @classmethod
-    def send_del_by_id(cls, sta_id):
+    def send_del_by_id(cls, sta_id, block=True):
         # type: (int) -> int
         """
         Send an update to the wmediumd server
         :param sta_id: The wmediumd index of the station
+        :param block: when False return a w_future instead of waiting
         :return: A WUPDATE_* constant
         """
-        cls.sock.send(cls.__create_station_del_by_id_request(sta_id))
-        return cls.__parse_response(
-            w_cst.WSERVER_DEL_BY_ID_RESPONSE_TYPE,
-            cls.__station_del_by_id_response_struct)[-1]
+        future = cls.__request(cls.__create_station_del_by_id_request(sta_id),
+                               w_cst.WSERVER_DEL_BY_ID_RESPONSE_TYPE,
+                               keyed=False)
+        return future.result() if block else future
 
     @classmethod
     def send_add(cls, mac):
@@ -1071,157 +1275,207 @@ def send_add(cls, mac):
         :return: A WUPDATE_* constant and on success at the second pos
         the index
         """
-        cls.sock.send(cls.__create_station_add_request(mac))
-        resp = cls.__parse_response(
-            w_cst.WSERVER_ADD_RESPONSE_TYPE,
-            cls.__station_add_response_struct)
+        future = cls.__request(cls.__create_station_add_request(mac),
+                               w_cst.WSERVER_ADD_RESPONSE_TYPE, index=None)
+        resp = future.result()
         return resp[-1], resp[-2]
 
+    @classmethod
+    def __pack(cls, struct_, *values):
+        "packs values into a per thread buffer reused across requests"
+        # type: (struct.Struct, ...) -> bytearray
+        buffers = getattr(cls.__buffers, 'by_struct', None)
+        if buffers is None:
+            buffers = cls.__buffers.by_struct = {}
+        buf = buffers.get(struct_)
+        if buf is None:
+            buf = buffers[struct_] = bytearray(struct_.size)
+        struct_.pack_into(buf, 0, *values)
+        return buf
+
     @classmethod
     def __create_snr_update_request(cls, link):
         "snr update request"
-        # type: (SNRLink) -> str
-        msgtype = w_cst.WSERVER_SNR_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac_from = link.sta1intf.get_mac().replace(':', '').decode('hex')
-            mac_to = link.sta2intf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac_from = bytes.fromhex(link.sta1intf.get_mac().replace(':', ''))
-            mac_to = bytes.fromhex(link.sta2intf.get_mac().replace(':', ''))
-        snr = int(link.snr)
-        return cls.__snr_update_request_struct.pack(msgtype, mac_from,
-                                                    mac_to, snr)
+        # type: (SNRLink) -> bytearray
+        return cls.__pack(cls.__snr_update_request_struct,
+                          w_cst.WSERVER_SNR_UPDATE_REQUEST_TYPE,
+                          link.sta1intf.get_mac_bytes(),
+                          link.sta2intf.get_mac_bytes(), int(link.snr))
 
     @classmethod
     def __create_pos_update_request(cls, pos, posX, posY, posZ):
         "pos update request"
-        # type: (w_pos) -> str
-        msgtype = w_cst.WSERVER_POS_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac = pos.staintf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac = bytes.fromhex(pos.staintf.get_mac().replace(':', ''))
-        return cls.__pos_update_request_struct.pack(msgtype, mac,
-                                                    posX, posY, posZ)
+        # type: (w_pos) -> bytearray
+        return cls.__pack(cls.__pos_update_request_struct,
+                          w_cst.WSERVER_POS_UPDATE_REQUEST_TYPE,
+                          pos.staintf.get_mac_bytes(), posX, posY, posZ)
 
     @classmethod
     def __create_txpower_update_request(cls, txpower):
         "tx power update request"
-        # type: (w_txpower) -> str
-        msgtype = w_cst.WSERVER_TXPOWER_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac = txpower.staintf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac = bytes.fromhex((txpower.staintf.get_mac().replace(':', '')))
-        txpower_ = txpower.sta_txpower
-        return cls.__txpower_update_request_struct.pack(msgtype, mac, txpower_)
+        # type: (w_txpower) -> bytearray
+        return cls.__pack(cls.__txpower_update_request_struct,
+                          w_cst.WSERVER_TXPOWER_UPDATE_REQUEST_TYPE,
+                          txpower.staintf.get_mac_bytes(),
+                          txpower.sta_txpower)
 
     @classmethod
     def __create_gain_update_request(cls, gain):
         "antenna gain update request"
-        # type: (gain) -> str
-        msgtype = w_cst.WSERVER_GAIN_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac = gain.staintf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac = bytes.fromhex((gain.staintf.get_mac().replace(':', '')))
-        gain_ = gain.sta_gain
-        return cls.__gain_update_request_struct.pack(msgtype, mac, gain_)
+        # type: (gain) -> bytearray
+        return cls.__pack(cls.__gain_update_request_struct,
+                          w_cst.WSERVER_GAIN_UPDATE_REQUEST_TYPE,
+                          gain.staintf.get_mac_bytes(), gain.sta_gain)
 
     @classmethod
     def __create_gaussian_random_update_request(cls, gRandom):
         "gaussian random update request"
-        # type: (WmediumdGRandom) -> str
-        msgtype = w_cst.WSERVER_GAUSSIAN_RANDOM_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac = gRandom.staintf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac = bytes.fromhex((gRandom.staintf.get_mac().replace(':', '')))
-        gRandom_ = gRandom.sta_gaussian_random
-        return cls.__gaussian_random_update_request_struct.pack(msgtype, mac,
-                                                                gRandom_)
+        # type: (WmediumdGRandom) -> bytearray
+        return cls.__pack(cls.__gaussian_random_update_request_struct,
+                          w_cst.WSERVER_GAUSSIAN_RANDOM_UPDATE_REQUEST_TYPE,
+                          gRandom.staintf.get_mac_bytes(),
+                          gRandom.sta_gaussian_random)
 
     @classmethod
     def __create_height_update_request(cls, height):
         "height update request"
-        # type: (Height) -> str
-        msgtype = w_cst.WSERVER_HEIGHT_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac = height.staintf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac = bytes.fromhex((height.staintf.get_mac().replace(':', '')))
-        height_ = height.sta_height
-        return cls.__height_update_request_struct.pack(msgtype, mac, height_)
+        # type: (Height) -> bytearray
+        return cls.__pack(cls.__height_update_request_struct,
+                          w_cst.WSERVER_HEIGHT_UPDATE_REQUEST_TYPE,
+                          height.staintf.get_mac_bytes(), height.sta_height)
 
     @classmethod
     def __create_errprob_update_request(cls, link):
         "error prob update request"
-        # type: (ERRPROBLink) -> str
-        msgtype = w_cst.WSERVER_ERRPROB_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac_from = link.sta1intf.get_mac().replace(':', '').decode('hex')
-            mac_to = link.sta2intf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac_from = bytes.fromhex((link.sta1intf.get_mac().replace(':', '')))
-            mac_to = bytes.fromhex((link.sta2intf.get_mac().replace(':', '')))
+        # type: (ERRPROBLink) -> bytearray
         errprob = cls.__conv_float_to_fixed_point(link.errprob)
-        return cls.__errprob_update_request_struct.pack(msgtype, mac_from, mac_to,
-                                                        errprob)
+        return cls.__pack(cls.__errprob_update_request_struct,
+                          w_cst.WSERVER_ERRPROB_UPDATE_REQUEST_TYPE,
+                          link.sta1intf.get_mac_bytes(),
+                          link.sta2intf.get_mac_bytes(), errprob)
 
     @classmethod
     def __create_specprob_update_request(cls, link):
         "specprob update request"
-        # type: (WmediumdSPECPROBLink) -> str
-        msgtype = w_cst.WSERVER_SPECPROB_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac_from = link.sta1int.get_mac().replace(':', '').decode('hex')
-            mac_to = link.sta2intf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac_from = bytes.fromhex((link.sta1intf.get_mac().replace(':', '')))
-            mac_to = bytes.fromhex((link.sta2intf.get_mac().replace(':', '')))
+        # type: (WmediumdSPECPROBLink) -> bytearray
         fixed_points = [None] * 144
         for size_idx in range(0, 12):
             for rate_idx in range(0, 12):
                 fixed_points[size_idx * 12 + rate_idx] = \
                     cls.__conv_float_to_fixed_point(
                         link.errprobs[size_idx][rate_idx])
-        return cls.__specprob_update_request_struct.pack(msgtype, mac_from,
-                                                         mac_to, *fixed_points)
+        return cls.__pack(cls.__specprob_update_request_struct,
+                          w_cst.WSERVER_SPECPROB_UPDATE_REQUEST_TYPE,
+                          link.sta1intf.get_mac_bytes(),
+                          link.sta2intf.get_mac_bytes(), *fixed_points)
 
     @classmethod
     def __create_station_del_by_mac_request(cls, mac):
         "del station by mac"
-        # type: (str) -> str
-        msgtype = w_cst.WSERVER_DEL_BY_MAC_REQUEST_TYPE
-        macparsed = mac.replace(':', '').decode('hex')
-        return cls.__station_del_by_mac_request_struct.pack(msgtype, macparsed)
+        # type: (str) -> bytearray
+        return cls.__pack(cls.__station_del_by_mac_request_struct,
+                          w_cst.WSERVER_DEL_BY_MAC_REQUEST_TYPE,
+                          mac_to_bytes(mac))
 
     @classmethod
     def __create_station_del_by_id_request(cls, sta_id):
         "del station by id"
-        # type: (int) -> str
-        msgtype = w_cst.WSERVER_DEL_BY_ID_REQUEST_TYPE
-        return cls.__station_del_by_id_request_struct.pack(msgtype, sta_id)
+        # type: (int) -> bytearray
+        return cls.__pack(cls.__station_del_by_id_request_struct,
+                          w_cst.WSERVER_DEL_BY_ID_REQUEST_TYPE, sta_id)
 
     @classmethod
     def __create_station_add_request(cls, mac):
         "add station"
-        # type: (str) -> str
-        msgtype = w_cst.WSERVER_ADD_REQUEST_TYPE
-        macparsed = mac.replace(':', '').decode('hex')
-        return cls.__station_add_request_struct.pack(msgtype, macparsed)
+        # type: (str) -> bytearray
+        return cls.__pack(cls.__station_add_request_struct,
+                          w_cst.WSERVER_ADD_REQUEST_TYPE, mac_to_bytes(mac))
 
     @classmethod
-    def __parse_response(cls, expected_type, resp_struct):
-        "parse response"
-        # type: (int, struct.Struct) -> tuple
-        recvd_data = cls.sock.recv(resp_struct.size)
-        # recvd_type = cls.__base_struct.unpack(recvd_data[0])[0]
-        # if recvd_type != expected_type:
-        #    raise WmediumdException(
-        #        "Received response of unknown type %d, expected %d" % (recvd_type,
-        # expected_type))
-        return resp_struct.unpack(recvd_data)
+    def __request(cls, data, response_type, keyed=True, index=-1):
+        "sends a request, the response is delivered to the returned future"
+        # type: (bytes, int, bool, int) -> w_future
+        # the first mac of the request is echoed in the response
+        future = w_future(bytes(data[1:7]) if keyed else None, index)
+        with cls.send_lock:
+            if not cls.connected:
+                raise WmediumdException("Not yet connected to wmediumd "
+                                        "server")
+            with cls.pending_lock:
+                cls.pending.setdefault(response_type, deque()).append(future)
+            try:
+                cls.sock.sendall(data)
+            except socket.error as e:
+                with cls.pending_lock:
+                    cls.pending[response_type].remove(future)
+                raise WmediumdException("Unable to send request to "
+                                        "wmediumd: %s" % e)
+        return future
+
+    @classmethod
+    def __read_responses(cls, sock):
+        "reads responses and hands them over to the waiting futures"
+        # type: (socket.socket) -> None
+        try:
+            while True:
+                head = cls.__recv_exactly(sock, cls.__base_struct.size)
+                recvd_type = cls.__base_struct.unpack(head)[0]
+                resp_struct = cls.__response_structs.get(recvd_type)
+                if resp_struct is None:
+                    raise WmediumdException("Received response of unknown "
+                                            "type %d" % recvd_type)
+                resp = resp_struct.unpack(
+                    head + cls.__recv_exactly(sock, resp_struct.size -
+                                              len(head)))
+                cls.__dispatch(recvd_type, resp)
+        except (socket.error, WmediumdException) as e:
+            exc = e if isinstance(e, WmediumdException) else \
+                WmediumdException("Connection to wmediumd lost: %s" % e)
+            with cls.send_lock:
+                if cls.sock is sock:
+                    cls.connected = False
+                with cls.pending_lock:
+                    pending = cls.pending
+                    cls.pending = {}
+            for futures in pending.values():
+                for future in futures:
+                    future.set_exception(exc)
+
+    @classmethod
+    def __dispatch(cls, recvd_type, resp):
+        "matches a response with its request by type and mac"
+        # type: (int, tuple) -> None
+        key = None
+        for value in resp:
+            if isinstance(value, bytes) and len(value) == 6:
+                key = value
+                break
+        with cls.pending_lock:
+            futures = cls.pending.get(recvd_type)
+            if not futures:
+                error('%s Unexpected response of type %d\n'
+                      % (w_cst.LOG_PREFIX, recvd_type))
+                return
+            future = futures[0]
+            for candidate in futures:
+                if candidate.key is None or candidate.key == key:
+                    future = candidate
+                    break
+            futures.remove(future)
+        future.set_result(resp)
+
+    @staticmethod
+    def __recv_exactly(sock, size):
+        "receives exactly size bytes (recv may return less)"
+        # type: (socket.socket, int) -> bytes
+        chunks = []
+        while size > 0:
+            chunk = sock.recv(size)
+            if not chunk:
+                raise WmediumdException("Connection to wmediumd closed")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
 
     @classmethod
     def __conv_float_to_fixed_point(cls, d):
@@ -1230,3 +1484,169 @@ def __conv_float_to_fixed_point(cls, d):
         beforecomma = int(d)
         aftercomma = int(((d - beforecomma) * one_shifted))
         return ctypes.c_int32(beforecomma << shift_amount).value + aftercomma
+
+
+w_starter.server = w_server
+
+
+class w_medium(object):
+    """A wireless medium: a part of the interfaces with a wmediumd of its
+    own (process, config, log and socket) and its own connection to it,
+    i.e. w_starter and w_server classes of its own. Frames only go between
+    interfaces of the same medium, and every medium runs its own event
+    loop. The first medium uses w_starter and w_server themselves.
+
+    Internal: mac80211_hwsim lets a single wmediumd register per network
+    namespace, and the bundled wmediumd always listens on the same socket,
+    so only the first medium can run with them. The others need servers
+    set up by hand (e.g. w_stub in the tests)"""
+
+    media = []
+    ids = {}  # interface id -> name of its medium (first medium if missing)
+    socket_path = '/var/run/wmediumd-%s.sock'
+    parameters = []  # wmediumd arguments of the media but the first one
+
+    def __init__(self, name, first=False):
+        self.name = name
+        if first:
+            self.starter, self.server = w_starter, w_server
+            return
+        socket_path = self.socket_path % name
+        self.server = type('w_server_%s' % name, (w_server,), dict(
+            sock=None, connected=False, reader=None, send_lock=Lock(),
+            pending_lock=Lock(), pending={}, socket_path=socket_path))
+        self.starter = type('w_starter_%s' % name, (w_starter,), dict(
+            is_managed=False, is_initialized=False, is_connected=False,
+            wmd_process=None, wmd_logfile=None, wmd_config_name=None,
+            data={}, server=self.server, parameters=[
+                param.replace('%s', socket_path)
+                for param in self.parameters]))
+        self.server.starter = self.starter
+
+    @classmethod
+    def assign(cls, ids, parameters=None):
+        """Sets the medium of the interfaces
+
+        :param ids: dict of interface id (WmediumdIntfRef.id()) -> medium
+        :param parameters: wmediumd arguments of the media but the first
+        one, %s being replaced by the socket path of the medium"""
+        cls.ids = ids
+        if parameters is not None:
+            cls.parameters = parameters
+
+    @staticmethod
+    def get_medium(node, wlan, by):
+        "Medium of an interface given its channel or band"
+        if by == 'band':
+            return '5GHz' if float(node.params['freq'][wlan]) >= 5 \
+                else '2.4GHz'
+        return 'ch%s' % node.params['channel'][wlan]
+
+    @classmethod
+    def split(cls, nodes, aps, by='channel', groups=None):
+        """Medium of every interface of nodes, as expected by assign()
+
+        :param nodes: the nodes (APs included)
+        :param aps: the APs
+        :param by: 'channel' or 'band': a medium per AP channel or band.
+        AP, adhoc and mesh interfaces go by their own channel or band.
+        Client interfaces join the medium of the closest AP (the one they
+        will associate with) when the media are split, so they can only
+        roam between the APs of that medium afterwards
+        :param groups: dict of medium name -> nodes, the interfaces of the
+        other nodes being split by channel/band"""
+        groups = groups or {}
+        ids = {}
+        media = {}  # AP -> medium of its clients
+        clients = []
+        for node in nodes:
+            names = [name for name in sorted(groups) if node in groups[name]]
+            for wlan in range(len(node.params['mac'])):
+                if names:
+                    medium = names[0]
+                elif node.func[wlan] in ['adhoc', 'mesh', 'ap'] or \
+                        node in aps:
+                    medium = cls.get_medium(node, wlan, by)
+                else:
+                    clients.append((node, wlan))
+                    continue
+                if node in aps and node not in media:
+                    media[node] = medium
+                ids['%s.%s' % (node.name, node.params['wlan'][wlan])] = medium
+
+        for node, wlan in clients:
+            near = [ap for ap in media if 'position' in ap.params]
+            if near and 'position' in node.params:
+                medium = media[min(near, key=node.get_distance_to)]
+            elif media:
+                medium = media[[ap for ap in aps if ap in media][0]]
+            else:
+                medium = cls.get_medium(node, wlan, by)
+            ids['%s.%s' % (node.name, node.params['wlan'][wlan])] = medium
+        return ids
+
+    @classmethod
+    def start(cls, intfrefs, links, isnodeaps, pos=None, txpowers=None,
+              **kwargs):
+        """Starts a wmediumd per medium with its interfaces, links,
+        positions and txpowers (see w_starter.start)"""
+        names = []
+        members = {}
+        for intfref, isnodeap in zip(intfrefs, isnodeaps):
+            name = cls.ids.get(intfref.id(),
+                               names[0] if names else 'default')
+            if name not in members:
+                names.append(name)
+                members[name] = ([], [])
+            members[name][0].append(intfref)
+            members[name][1].append(isnodeap)
+        if len(names) > 1 and \
+                not any('%s' in param for param in cls.parameters):
+            raise WmediumdException(
+                'media %s need wmediumd parameters giving each one its own '
+                'socket (%%s): they would all listen on %s'
+                % (', '.join(names[1:]), w_cst.SOCKET_PATH))
+
+        cls.media = []
+        w_server.servers = {}
+        for name in names:
+            medium = cls(name, first=not cls.media)
+            cls.media.append(medium)
+            refs, aps = members[name]
+            ids = set(intfref.id() for intfref in refs)
+            for intfref in refs:
+                w_server.servers[intfref.get_mac()] = medium.server
+            info('*** Starting wmediumd of medium %s (%d interfaces)\n'
+                 % (name, len(refs)))
+            medium.starter.start(
+                refs, [link for link in links if link.sta1intf.id() in ids
+                       and link.sta2intf.id() in ids], isnodeaps=aps,
+                pos=[p for p in pos or [] if p.staintf.id() in ids],
+                txpowers=[txpower for txpower in txpowers or []
+                          if txpower.staintf.id() in ids], **kwargs)
+
+    @classmethod
+    def restart(cls, pos=None, txpowers=None, **kwargs):
+        """Starts the wmediumd of every medium again (see
+        w_starter.restart), with its part of pos and txpowers"""
+        for medium in cls.media:
+            ids = set(intfref.id() for intfref in
+                      medium.starter.data['intfrefs'])
+            data = dict(kwargs)
+            if pos is not None:
+                data['pos'] = [p for p in pos if p.staintf.id() in ids]
+            if txpowers is not None:
+                data['txpowers'] = [txpower for txpower in txpowers
+                                    if txpower.staintf.id() in ids]
+            medium.starter.restart(**data)
+
+    @classmethod
+    def stop(cls):
+        "Stops the wmediumd of every medium"
+        for medium in cls.media:
+            if medium.server.connected:
+                medium.server.disconnect()
+            if medium.starter.is_connected:
+                medium.starter.stop()
+        cls.media = []
+        w_server.servers = {}
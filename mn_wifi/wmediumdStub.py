@@ -0,0 +1,220 @@
+"""Mininet-WiFi: A simple networking testbed for Wireless OpenFlow/SDWN!
+
+   Stand-in for the server of wmediumd: it speaks the protocol of
+   w_server on a UNIX domain socket, records every request and answers it
+   after a given latency with a given code. The connector, the batched
+   updates and the mobility paths can so be tested and benchmarked
+   without wmediumd or mac80211_hwsim, e.g.:
+
+       stub = w_stub(latency=0.0001).start()
+       w_server.connect(stub.path)
+       ...
+       w_server.disconnect()
+       stub.stop()
+
+   python -m mn_wifi.wmediumdStub [updates] runs a small benchmark of
+   single and batched position updates."""
+
+import os
+import socket
+import struct
+import sys
+import tempfile
+from threading import Thread, Lock
+from time import sleep, time
+
+from mn_wifi.wmediumdConnector import w_cst
+
+
+class w_stub(object):
+    "Stand-in wmediumd server"
+
+    # request type -> (format of the request after the type, response type)
+    requests = {
+        w_cst.WSERVER_SNR_UPDATE_REQUEST_TYPE:
+            ('6s6si', w_cst.WSERVER_SNR_UPDATE_RESPONSE_TYPE),
+        w_cst.WSERVER_DEL_BY_MAC_REQUEST_TYPE:
+            ('6s', w_cst.WSERVER_DEL_BY_MAC_RESPONSE_TYPE),
+        w_cst.WSERVER_DEL_BY_ID_REQUEST_TYPE:
+            ('i', w_cst.WSERVER_DEL_BY_ID_RESPONSE_TYPE),
+        w_cst.WSERVER_ADD_REQUEST_TYPE:
+            ('6s', w_cst.WSERVER_ADD_RESPONSE_TYPE),
+        w_cst.WSERVER_ERRPROB_UPDATE_REQUEST_TYPE:
+            ('6s6si', w_cst.WSERVER_ERRPROB_UPDATE_RESPONSE_TYPE),
+        w_cst.WSERVER_SPECPROB_UPDATE_REQUEST_TYPE:
+            ('6s6s144i', w_cst.WSERVER_SPECPROB_UPDATE_RESPONSE_TYPE),
+        w_cst.WSERVER_POS_UPDATE_REQUEST_TYPE:
+            ('6sfff', w_cst.WSERVER_POS_UPDATE_RESPONSE_TYPE),
+        w_cst.WSERVER_TXPOWER_UPDATE_REQUEST_TYPE:
+            ('6si', w_cst.WSERVER_TXPOWER_UPDATE_RESPONSE_TYPE),
+        w_cst.WSERVER_GAIN_UPDATE_REQUEST_TYPE:
+            ('6si', w_cst.WSERVER_GAIN_UPDATE_RESPONSE_TYPE),
+        w_cst.WSERVER_HEIGHT_UPDATE_REQUEST_TYPE:
+            ('6si', w_cst.WSERVER_HEIGHT_UPDATE_RESPONSE_TYPE),
+        w_cst.WSERVER_GAUSSIAN_RANDOM_UPDATE_REQUEST_TYPE:
+            ('6sf', w_cst.WSERVER_GAUSSIAN_RANDOM_UPDATE_RESPONSE_TYPE),
+    }
+
+    def __init__(self, path=None, latency=0, code=w_cst.WUPDATE_SUCCESS,
+                 codes=None):
+        """
+        :param path: path of the socket (a new temporary one by default)
+        :param latency: seconds waited before answering every request
+        :param code: WUPDATE_* code of the responses
+        :param codes: request type -> WUPDATE_* code, overriding code"""
+        self.tmpdir = None
+        if path is None:
+            self.tmpdir = tempfile.mkdtemp(prefix='mn_wmd_stub_')
+            path = os.path.join(self.tmpdir, 'wmediumd.sock')
+        self.path = path
+        self.latency = latency
+        self.code = code
+        self.codes = codes or {}
+        self.received = []  # (request type, values), macs as strings
+        self.stations = []  # macs added, the index being their id
+        self.lock = Lock()
+        self.sock = None
+        self.conns = []
+        self.threads = []
+
+    def start(self):
+        "Listens on path, answering every connection in a thread"
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(5)
+        self.run(self.accept)
+        return self
+
+    def stop(self):
+        "Closes the socket and every connection"
+        for sock in [self.sock] + self.conns:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            sock.close()
+        for thread in self.threads:
+            thread.join(1)
+        self.conns = []
+        self.threads = []
+        try:
+            os.remove(self.path)
+            if self.tmpdir:
+                os.rmdir(self.tmpdir)
+        except OSError:
+            pass
+
+    def run(self, target, *args):
+        thread = Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            self.conns.append(conn)
+            self.run(self.serve, conn)
+
+    @staticmethod
+    def recv_exactly(conn, size):
+        "size bytes, or None if the connection was closed"
+        data = b''
+        while len(data) < size:
+            try:
+                chunk = conn.recv(size - len(data))
+            except socket.error:
+                return None
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    @staticmethod
+    def get_mac(value):
+        return ':'.join('%02x' % byte for byte in bytearray(value))
+
+    def serve(self, conn):
+        "Answers the requests of a connection, one at a time as wmediumd"
+        while True:
+            head = self.recv_exactly(conn, 1)
+            if head is None:
+                return
+            type_ = struct.unpack('!B', head)[0]
+            if type_ == w_cst.WSERVER_SHUTDOWN_REQUEST_TYPE:
+                return conn.close()
+            fmt, response_type = self.requests[type_]
+            body = self.recv_exactly(conn, struct.calcsize('!' + fmt))
+            if body is None:
+                return
+            values = tuple(self.get_mac(value) if isinstance(value, bytes)
+                           else value
+                           for value in struct.unpack('!' + fmt, body))
+            code = self.codes.get(type_, self.code)
+            response = struct.pack('!B', response_type) + head + body
+            with self.lock:
+                self.received.append((type_, values))
+                if type_ == w_cst.WSERVER_ADD_REQUEST_TYPE:
+                    response += struct.pack('!i', len(self.stations))
+                    if code == w_cst.WUPDATE_SUCCESS:
+                        self.stations.append(values[0])
+                elif type_ == w_cst.WSERVER_DEL_BY_MAC_REQUEST_TYPE \
+                        and values[0] in self.stations:
+                    self.stations.remove(values[0])
+            if type_ == w_cst.WSERVER_SPECPROB_UPDATE_REQUEST_TYPE:
+                response = response[:14]  # only the macs are echoed
+            if self.latency:
+                sleep(self.latency)
+            try:
+                conn.sendall(response + struct.pack('!B', code))
+            except socket.error:
+                return
+
+    def get(self, request_type):
+        "Values of the requests of a type received so far"
+        with self.lock:
+            return [values for type_, values in self.received
+                    if type_ == request_type]
+
+    def clear(self):
+        with self.lock:
+            self.received = []
+
+
+def benchmark(updates=10000, latency=0):
+    "Seconds taken by updates position updates, one by one and batched"
+    from mn_wifi.wmediumdConnector import w_server, w_pos, WmediumdIntfRef
+
+    stub = w_stub(latency=latency).start()
+    w_server.connect(stub.path)
+    intfs = [WmediumdIntfRef('sta%d' % idx, 'sta%d-wlan0' % idx,
+                             '02:00:00:%02x:%02x:00' % (idx // 256,
+                                                        idx % 256))
+             for idx in range(256)]
+    positions = [w_pos(intfs[idx % len(intfs)], [idx, idx, 0])
+                 for idx in range(updates)]
+    times = []
+    try:
+        start = time()
+        for pos in positions:
+            w_server.update_pos(pos, None)
+        times.append(time() - start)
+        start = time()
+        w_server.update_pos_batch(positions)
+        times.append(time() - start)
+    finally:
+        w_server.disconnect()
+        stub.stop()
+    return times
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    single, batch = benchmark(count)
+    print('%d position updates: %.3f s one by one, %.3f s batched'
+          % (count, single, batch))
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+
+"""
+Benchmark of the path loss tables of mn_wifi.propagationModels
+
+Compares computing the free space reference loss on every call (what the
+propagation models used to do) with the lookups of pathLossTable, and the
+scalar propagation models with propagationModel.rssi_matrix.
+
+usage: pathlossbench.py [calls]
+
+The speedups are relative to the line above.
+"""
+
+from random import Random
+from sys import argv, path
+from timeit import default_timer as timer
+import os
+
+path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mn_wifi.propagationModels import pathLossTable, propagationModel
+
+
+class node(object):
+    "Just the params the propagation models read"
+
+    def __init__(self, freq):
+        self.params = {'freq': [freq], 'txpower': [14], 'antennaGain': [5],
+                       'antennaHeight': [1]}
+
+
+def bench(name, func, args, base=None):
+    "Runs func over args, prints the time taken and returns it"
+    start = timer()
+    for arg in args:
+        func(*arg)
+    elapsed = timer() - start
+    speedup = ''
+    if base:
+        speedup = '%6.1fx' % (base / elapsed)
+    print('%-40s %8.3f s %s' % (name, elapsed, speedup))
+    return elapsed
+
+
+def main():
+    calls = int(argv[1]) if len(argv) > 1 else 200000
+    rand = Random(1)
+    freqs = [2.412, 2.437, 5.18]
+    args = [(rand.choice(freqs), rand.uniform(1, 500), 1)
+            for _ in range(calls)]
+    ref_args = [(freq, 1, L) for freq, _, L in args]
+
+    print('%d calls' % calls)
+    base = bench('reference loss, computed', pathLossTable.compute,
+                 ref_args)
+    bench('reference loss, pathLossTable', pathLossTable.loss,
+          ref_args, base)
+
+    stations = [node(rand.choice(freqs)) for _ in range(200)]
+    aps = [node(rand.choice(freqs)) for _ in range(calls // 200)]
+    dists = [[rand.uniform(0, 500) for _ in aps] for _ in stations]
+    for model in ['friis', 'logDistance', 'ITU']:
+        propagationModel.setAttr(model=model)
+        pairs = [(sta, ap, dists[i][j], 0)
+                 for i, sta in enumerate(stations)
+                 for j, ap in enumerate(aps)]
+        base = bench('%s, one link per call' % model,
+                     propagationModel, pairs)
+        bench('%s, rssi_matrix' % model, propagationModel.rssi_matrix,
+              [(aps, stations, dists)], base)
+
+
+if __name__ == '__main__':
+    main()